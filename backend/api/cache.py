@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class ReferenceCache:
+    """Версионированный кеш ответов со справочными данными.
+
+    Два уровня: словарь в памяти процесса и общий кеш Django
+    (settings.REFERENCE_CACHE_ALIAS). Номер версии хранится в общем
+    кеше; invalidate() увеличивает его, и все процессы перестают
+    видеть старые записи — локально не позже чем через
+    REFERENCE_CACHE_VERSION_TTL секунд.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._version = None
+        self._version_checked = 0
+
+    @property
+    def shared(self):
+        return caches[settings.REFERENCE_CACHE_ALIAS]
+
+    @property
+    def version_key(self):
+        return f'reference:{self.namespace}:version'
+
+    def get_version(self):
+        now = time.monotonic()
+        if (self._version is None or now - self._version_checked
+                > settings.REFERENCE_CACHE_VERSION_TTL):
+            self.shared.add(self.version_key, 1, timeout=None)
+            version = self.shared.get(self.version_key, 1)
+            with self._lock:
+                if version != self._version:
+                    self._local.clear()
+                self._version = version
+                self._version_checked = now
+        return self._version
+
+    def invalidate(self):
+        try:
+            version = self.shared.incr(self.version_key)
+        except ValueError:
+            version = int(time.time())
+            self.shared.set(self.version_key, version, timeout=None)
+        with self._lock:
+            self._local.clear()
+            self._version = version
+            self._version_checked = time.monotonic()
+
+    def get_or_set(self, key, compute):
+        """Пара (etag, data) по ключу; при промахе вызывает compute()."""
+        version = self.get_version()
+        full_key = f'reference:{self.namespace}:{version}:{key}'
+        with self._lock:
+            entry = self._local.get(full_key)
+            if entry is not None:
+                self._local.move_to_end(full_key)
+                return entry
+        entry = self.shared.get(full_key)
+        if entry is None:
+            data = compute()
+            payload = json.dumps(data, cls=DjangoJSONEncoder,
+                                 sort_keys=True, ensure_ascii=False)
+            etag = 'W/"{}"'.format(
+                hashlib.md5(payload.encode()).hexdigest())
+            entry = (etag, data)
+            self.shared.set(full_key, entry,
+                            timeout=settings.REFERENCE_CACHE_TIMEOUT)
+        with self._lock:
+            self._local[full_key] = entry
+            while len(self._local) > settings.REFERENCE_CACHE_LOCAL_SIZE:
+                self._local.popitem(last=False)
+        return entry
+
+
+tags_cache = ReferenceCache('tags')
+ingredients_cache = ReferenceCache('ingredients')
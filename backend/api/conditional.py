@@ -0,0 +1,134 @@
+import hashlib
+import json
+
+from api.cache import ingredients_cache, tags_cache
+from api.membership import get_membership
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+# Поля рецепта, от которых зависит ETag.
+VERSION_FIELDS = ('id', 'author_id', 'pub_date', 'updated_at')
+
+
+def recipe_validators(request, recipes, *state):
+    """ETag и Last-Modified для набора рецептов.
+
+    В ETag входят id и updated_at рецептов, версии справочников тегов
+    и ингредиентов, дополнительное состояние state (например, число
+    рецептов на странице) и, для пользователя, его флаги избранного,
+    корзины и подписки на авторов. Last-Modified отдаётся только
+    анониму: изменение флагов не меняет updated_at.
+    """
+    membership = get_membership(request)
+    parts = [str(tags_cache.get_version()),
+             str(ingredients_cache.get_version()),
+             *map(str, state)]
+    for recipe in recipes:
+        parts.append(f'{recipe.pk}:{recipe.updated_at.timestamp()}')
+        if membership is not None:
+            parts.append('{:d}{:d}{:d}'.format(
+                recipe.pk in membership.favorites,
+                recipe.pk in membership.cart,
+                recipe.author_id in membership.following))
+    etag = 'W/"{}"'.format(
+        hashlib.md5('|'.join(parts).encode()).hexdigest())
+    last_modified = None
+    if membership is None and recipes:
+        last_modified = int(max(
+            max(recipe.updated_at, recipe.pub_date) for recipe in recipes
+        ).timestamp())
+    return etag, last_modified
+
+
+def etag_response(request, etag, respond, last_modified=None):
+    """Ответ 304, если валидаторы клиента совпали (ETag сравнивается
+    слабо, поэтому совпадает и W/-версия от gzip в nginx); иначе
+    respond()."""
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = respond()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_response(request, recipes, respond, *state):
+    """Ответ 304, если у клиента актуальная версия рецептов; иначе
+    respond(). Сериализация выполняется только во втором случае."""
+    etag, last_modified = recipe_validators(request, recipes, *state)
+    return etag_response(request, etag, respond, last_modified)
+
+
+def patch_api_cache_control(request, response, max_age=0):
+    """Анонимный ответ кешируется публично на max_age секунд (nginx и
+    браузер); остальные — только в браузере пользователя и с проверкой
+    по ETag перед каждым использованием."""
+    patch_vary_headers(response, ('Authorization',))
+    if (max_age and not request.user.is_authenticated
+            and response.status_code in (200, 304)):
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+
+
+class CacheControlMixin:
+    """Cache-Control для GET-запросов вьюсета: публичное кеширование
+    на cache_max_age секунд действует для public_cache_actions."""
+    cache_max_age = 0
+    public_cache_actions = ('list', 'retrieve')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            public = self.action in self.public_cache_actions
+            patch_api_cache_control(
+                request, response, self.cache_max_age if public else 0)
+        return response
+
+
+class _UncachedResponse(Exception):
+    """Ответ, который нельзя класть в кеш (например, ошибка)."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ReferenceCacheMixin:
+    """Кеширование list/retrieve вьюсета в reference_cache и ответы 304
+    по ETag."""
+    reference_cache = None
+
+    def _cache_key(self, request):
+        params = sorted(request.query_params.lists())
+        return hashlib.md5(
+            f'{request.path}?{params}'.encode()).hexdigest()
+
+    def _cached_response(self, request, view, *args, **kwargs):
+        def compute():
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                raise _UncachedResponse(response)
+            return json.loads(json.dumps(response.data,
+                                         cls=DjangoJSONEncoder))
+
+        try:
+            etag, data = self.reference_cache.get_or_set(
+                self._cache_key(request), compute)
+        except _UncachedResponse as uncached:
+            return uncached.response
+        return etag_response(request, etag, lambda: Response(data))
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve,
+                                     *args, **kwargs)
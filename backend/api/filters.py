@@ -1,12 +1,15 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import (BooleanFilter, CharFilter,
                                            FilterSet,
                                            ModelMultipleChoiceFilter,
                                            NumberFilter)
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import FavoriteList, Ingredient, Recipe, ShoppingList, Tag
 
 
 class IngredientFilter(FilterSet):
     """Фильтр ингредиентов"""
+    name = CharFilter(method='filter_autocomplete')
     start_name = CharFilter(field_name='name',
                             lookup_expr='istartswith')
     contain_name = CharFilter(field_name='name',
@@ -16,33 +19,51 @@ class IngredientFilter(FilterSet):
         model = Ingredient
         fields = ('name',)
 
+    def filter_autocomplete(self, queryset, name, value):
+        # Автодополнение ограничивает выборку, поэтому применяется
+        # в filter_queryset после остальных фильтров.
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        query = self.form.cleaned_data.get('name')
+        if query:
+            return queryset.autocomplete(
+                query, settings.INGREDIENTS_AUTOCOMPLETE_LIMIT)
+        return queryset
+
 
 class RecipeFilter(FilterSet):
     """Фильтр рецептов"""
-    is_favorited = BooleanFilter(
-        field_name='favorite_lists__user', method='filter_by_favorite'
-    )
-    author = NumberFilter(field_name='author__id')
-    is_in_shopping_cart = BooleanFilter(
-        field_name='shopping_lists__user', method='filter_by_shopping'
-    )
-    tags = ModelMultipleChoiceFilter(field_name='tags__slug',
-                                     to_field_name='slug',
-                                     queryset=Tag.objects.all()
-                                     )
+    is_favorited = BooleanFilter(method='filter_by_favorite')
+    author = NumberFilter(field_name='author_id')
+    is_in_shopping_cart = BooleanFilter(method='filter_by_shopping_list')
+    tags = ModelMultipleChoiceFilter(to_field_name='slug',
+                                     queryset=Tag.objects.all(),
+                                     method='filter_by_tags')
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_in_shopping_cart', 'is_favorited',)
 
-    def filter_by_favorite(self, queryset, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(favorite_lists__user=user)
-        return queryset.none()
+    def filter_by_tags(self, queryset, name, value):
+        # Без ?tags= поле возвращает пустую выборку, а не пустой список.
+        if not value:
+            return queryset
+        return queryset.with_any_tag(value)
 
-    def filter_by_shopping_list(self, queryset, value):
+    def filter_by_user_list(self, queryset, value, model):
+        if not value:
+            return queryset
         user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(shopping_lists__user=user)
-        return queryset.none()
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(
+            model.objects.filter(user=user, recipe_id=OuterRef('pk'))
+        ))
+
+    def filter_by_favorite(self, queryset, name, value):
+        return self.filter_by_user_list(queryset, value, FavoriteList)
+
+    def filter_by_shopping_list(self, queryset, name, value):
+        return self.filter_by_user_list(queryset, value, ShoppingList)
@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы длительности запросов, с.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_local = Local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    """Измерения одного запроса."""
+
+    def __init__(self):
+        self.view = 'unresolved'
+        self.budget = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.timings = defaultdict(float)
+        self.active = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} SQL"',
+            f"serialize;dur={self.timings['serialize'] * 1000:.1f}",
+            f"render;dur={self.timings['render'] * 1000:.1f}",
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def timing(name):
+    """Добавляет время блока к метрике name текущего запроса.
+
+    Вложенные блоки с тем же name не учитываются повторно, поэтому
+    вложенные сериализаторы не удваивают время.
+    """
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+        metrics.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Время to_representation попадает в метрику serialize."""
+
+    def to_representation(self, instance):
+        with timing('serialize'):
+            return super().to_representation(instance)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer, время которого попадает в метрику render."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timing('render'):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+
+class MetricsRegistry:
+    """Счётчики процесса в формате Prometheus.
+
+    Каждый процесс gunicorn считает свои запросы, поэтому метрики
+    собираются с каждого процесса отдельно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self._durations = defaultdict(float)
+        self._totals = defaultdict(float)
+        self._budget_exceeded = defaultdict(int)
+
+    def observe(self, metrics, method, status, total, size):
+        view = metrics.view
+        with self._lock:
+            self._requests[view, method, status] += 1
+            buckets = self._buckets[view]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    buckets[index] += 1
+            self._durations[view] += total
+            self._totals['db_queries_total', view] += metrics.queries
+            self._totals['db_query_seconds_total', view] += metrics.sql_time
+            self._totals['serialize_seconds_total', view] += (
+                metrics.timings['serialize'])
+            self._totals['render_seconds_total', view] += (
+                metrics.timings['render'])
+            if size is not None:
+                self._totals['response_bytes_total', view] += size
+            if metrics.budget is not None and metrics.queries > metrics.budget:
+                self._budget_exceeded[view] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ['# TYPE foodgram_http_requests_total counter']
+            for (view, method, status), count in sorted(
+                    self._requests.items()):
+                lines.append(
+                    f'foodgram_http_requests_total{{view="{view}",'
+                    f'method="{method}",status="{status}"}} {count}')
+            counts = defaultdict(int)
+            for (view, _, _), count in self._requests.items():
+                counts[view] += count
+            lines += ['# TYPE foodgram_http_request_duration_seconds '
+                      'histogram']
+            for view, buckets in sorted(self._buckets.items()):
+                name = 'foodgram_http_request_duration_seconds'
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(
+                        f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                        f'{count}')
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} '
+                             f'{counts[view]}')
+                lines.append(f'{name}_sum{{view="{view}"}} '
+                             f'{self._durations[view]:.6f}')
+                lines.append(f'{name}_count{{view="{view}"}} '
+                             f'{counts[view]}')
+            metric_names = sorted({name for name, _ in self._totals})
+            for metric_name in metric_names:
+                lines.append(f'# TYPE foodgram_{metric_name} counter')
+                for (name, view), value in sorted(self._totals.items()):
+                    if name == metric_name:
+                        lines.append(f'foodgram_{name}{{view="{view}"}} '
+                                     f'{value:g}')
+            lines += ['# TYPE foodgram_query_budget_exceeded_total counter']
+            for view, count in sorted(self._budget_exceeded.items()):
+                lines.append(f'foodgram_query_budget_exceeded_total'
+                             f'{{view="{view}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def recording(metrics):
+    """Учитывает в metrics запросы ко всем базам внутри блока."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(metrics.record_query))
+        yield
+
+
+def resolve_view(view_func, method):
+    """Класс представления (None для функций), его имя и действие
+    вьюсета DRF для метода method."""
+    view_class = getattr(view_func, 'cls', None)
+    name = view_class.__name__ if view_class else view_func.__name__
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method) or (
+        actions.get('get') if method == 'head' else None)
+    return view_class, name, action
+
+
+class InstrumentationMiddleware:
+    """Число и время SQL-запросов, время сериализации и размер ответа.
+
+    Итоги запроса отдаются в заголовке Server-Timing и копятся в
+    registry для /api/metrics/. Вьюсет может объявить бюджеты запросов
+    к базе по действиям: query_budgets = {'list': 5}. Превышение
+    пишется в лог, а при QUERY_BUDGET_STRICT — прерывает запрос
+    исключением QueryBudgetExceeded, чтобы тесты падали. У потокового
+    ответа в бюджет и registry входит и чтение тела, а Server-Timing
+    описывает только работу до его начала.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with recording(metrics):
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(
+                time.perf_counter() - started)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, metrics, request, response,
+                started)
+            return response
+        self.finish(metrics, request, response, started,
+                    len(response.content))
+        return response
+
+    def stream(self, content, metrics, request, response, started):
+        """Тело потокового ответа: запросы к базе, выполненные при его
+        чтении, тоже входят в бюджет."""
+        size = 0
+        with recording(metrics):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self.finish(metrics, request, response, started, size)
+
+    def finish(self, metrics, request, response, started, size):
+        total = time.perf_counter() - started
+        registry.observe(metrics, request.method, response.status_code,
+                         total, size)
+        if metrics.budget is not None and metrics.queries > metrics.budget:
+            message = (f'{metrics.view}: {metrics.queries} запросов к базе '
+                       f'при бюджете {metrics.budget}')
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(_local, 'metrics', None)
+        if metrics is None:
+            return None
+        view_class, name, action = resolve_view(view_func,
+                                                request.method.lower())
+        metrics.view = f'{name}.{action}' if action else name
+        budgets = getattr(view_class, 'query_budgets', None) or {}
+        metrics.budget = budgets.get(action)
+        return None
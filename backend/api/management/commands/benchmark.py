@@ -0,0 +1,213 @@
+import json
+import platform
+import random
+import statistics
+import time
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from recipes.models import FavoriteList, Ingredient, Recipe, ShoppingList, Tag
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+# Сколько рецептов, авторов и ингредиентов берётся для случайных
+# параметров запросов.
+SAMPLE_SIZE = 1000
+
+
+def percentile(values, share):
+    """Перцентиль share (0..1) отсортированного списка values."""
+    index = min(len(values) - 1, round(share * (len(values) - 1)))
+    return values[index]
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные запросы API внутри процесса через '
+            'тестовый клиент DRF и выводит JSON с пропускной способностью, '
+            'перцентилями задержки и числом SQL-запросов.')
+
+    scenarios = (
+        'recipes_list', 'recipes_list_auth', 'recipe_detail',
+        'recipes_filtered', 'recipes_favorited', 'subscriptions',
+        'ingredients_search', 'shopping_cart_download', 'feed',
+        'trending',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Запросов на сценарий.')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Запросов до начала замера.')
+        parser.add_argument('--scenario', action='append',
+                            choices=self.scenarios, dest='only',
+                            help='Запустить только этот сценарий; можно '
+                                 'указать несколько раз.')
+        parser.add_argument('--user', type=int,
+                            help='Пользователь для сценариев с '
+                                 'авторизацией; по умолчанию — '
+                                 'подписчик из последней подписки.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-отчёта.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        user = self.get_user(options['user'])
+        self.sample()
+        anonymous, authenticated = APIClient(), APIClient()
+        authenticated.force_authenticate(user)
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'favorites': FavoriteList.objects.count(),
+                'shopping_list': ShoppingList.objects.count(),
+                'follows': Follow.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'options': {key: options[key]
+                        for key in ('iterations', 'warmup', 'seed')},
+            'user': user.pk,
+            'scenarios': {},
+        }
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name in options['only'] or self.scenarios:
+                make_request = getattr(self, name)
+                client = authenticated if name in (
+                    'recipes_list_auth', 'recipes_favorited',
+                    'subscriptions', 'shopping_cart_download', 'feed',
+                ) else anonymous
+                report['scenarios'][name] = self.run(
+                    client, make_request, options['iterations'],
+                    options['warmup'])
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def get_user(self, user_id):
+        if user_id is None:
+            user_id = Follow.objects.order_by('-pk').values_list(
+                'user_id', flat=True).first()
+        user = (User.objects.filter(pk=user_id).first() if user_id
+                else User.objects.order_by('pk').first())
+        if user is None:
+            raise CommandError('Нет пользователей: запустите '
+                               'manage.py generate_dataset.')
+        return user
+
+    def sample(self):
+        self.recipe_ids = list(Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:SAMPLE_SIZE])
+        self.author_ids = list(User.objects.order_by(
+            '-recipes_count').values_list('pk', flat=True)[:SAMPLE_SIZE])
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredient_names = list(Ingredient.objects.values_list(
+            'name', flat=True)[:SAMPLE_SIZE])
+        if not self.recipe_ids or not self.ingredient_names:
+            raise CommandError('Нет рецептов или ингредиентов: запустите '
+                               'manage.py generate_dataset.')
+
+    def recipes_list(self):
+        return '/api/recipes/', {'page': self.random.randint(1, 5)}
+
+    recipes_list_auth = recipes_list
+
+    def recipe_detail(self):
+        return f'/api/recipes/{self.random.choice(self.recipe_ids)}/', {}
+
+    def recipes_filtered(self):
+        params = {'author': self.random.choice(self.author_ids)}
+        if self.tag_slugs:
+            params['tags'] = self.random.sample(
+                self.tag_slugs, min(2, len(self.tag_slugs)))
+        return '/api/recipes/', params
+
+    def recipes_favorited(self):
+        return '/api/recipes/', {'is_favorited': 1}
+
+    def subscriptions(self):
+        return '/api/users/subscriptions/', {'recipes_limit': 3}
+
+    def feed(self):
+        return '/api/users/feed/', {}
+
+    def trending(self):
+        return '/api/recipes/trending/', {'limit': 10}
+
+    def ingredients_search(self):
+        name = self.random.choice(self.ingredient_names)
+        return '/api/ingredients/', {
+            'name': name[:self.random.randint(1, 4)]}
+
+    def shopping_cart_download(self):
+        return '/api/recipes/download_shopping_cart/', {}
+
+    def run(self, client, make_request, iterations, warmup):
+        for _ in range(warmup):
+            client.get(*make_request())
+        counter = QueryCounter()
+        latencies, queries, sizes, statuses = [], [], [], {}
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(counter))
+            started = time.perf_counter()
+            for _ in range(iterations):
+                path, params = make_request()
+                counter.count = 0
+                request_started = time.perf_counter()
+                response = client.get(path, params)
+                body = (b''.join(response.streaming_content)
+                        if response.streaming else response.content)
+                latencies.append(time.perf_counter() - request_started)
+                queries.append(counter.count)
+                sizes.append(len(body))
+                status = str(response.status_code)
+                statuses[status] = statuses.get(status, 0) + 1
+            elapsed = time.perf_counter() - started
+        latencies = sorted(latency * 1000 for latency in latencies)
+        return {
+            'requests': iterations,
+            'errors': sum(count for status, count in statuses.items()
+                          if status >= '400'),
+            'statuses': statuses,
+            'throughput_rps': round(iterations / elapsed, 1),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 2),
+                'p50': round(percentile(latencies, 0.50), 2),
+                'p90': round(percentile(latencies, 0.90), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+                'max': round(latencies[-1], 2),
+            },
+            'queries': {
+                'mean': round(statistics.mean(queries), 2),
+                'max': max(queries),
+            },
+            'response_bytes': {
+                'mean': round(statistics.mean(sizes)),
+                'max': max(sizes),
+            },
+        }
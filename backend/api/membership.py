@@ -0,0 +1,107 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from recipes.models import FavoriteList, ShoppingList
+from users.models import Follow
+
+
+class UserMembership:
+    """id избранных рецептов, рецептов в корзине и авторов в подписках.
+
+    Загружается один раз на запрос (или берётся из общего кеша), после
+    чего флаги is_favorited, is_in_shopping_cart и is_subscribed
+    вычисляются проверкой вхождения в множество.
+    """
+
+    def __init__(self, favorites, cart, following):
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+        self.following = frozenset(following)
+
+    @classmethod
+    def load(cls, user_id):
+        # С основной базы: результат попадает в общий кеш, и отставшая
+        # реплика положила бы туда состояние до последней записи.
+        def ids(model, field):
+            return model.objects.using(DEFAULT_DB_ALIAS).filter(
+                user_id=user_id).values_list(field, flat=True)
+
+        return cls(ids(FavoriteList, 'recipe_id'),
+                   ids(ShoppingList, 'recipe_id'),
+                   ids(Follow, 'author_id'))
+
+
+def _cache_key(user_id):
+    return f'membership:{user_id}'
+
+
+def _version_key(user_id):
+    return f'membership:{user_id}:version'
+
+
+def _new_version():
+    # Начальная версия после вытеснения ключа из кеша не совпадает с
+    # версиями уже сохранённых записей.
+    return time.time_ns()
+
+
+def _shared_cache():
+    if not settings.MEMBERSHIP_CACHE_TIMEOUT:
+        return None
+    return caches[settings.MEMBERSHIP_CACHE_ALIAS]
+
+
+def get_membership(request):
+    """UserMembership текущего пользователя; None для анонима."""
+    if request is None or not request.user.is_authenticated:
+        return None
+    membership = getattr(request, '_membership', None)
+    if membership is not None:
+        return membership
+    user_id = request.user.pk
+    cache = _shared_cache()
+    if cache is None:
+        membership = UserMembership.load(user_id)
+    else:
+        membership = _cached_membership(cache, user_id)
+    request._membership = membership
+    return membership
+
+
+def set_membership(request, membership):
+    """Задаёт UserMembership запроса, если флаги известны без базы."""
+    request._membership = membership
+
+
+def _cached_membership(cache, user_id):
+    """Запись кеша хранит версию, прочитанную до загрузки из базы.
+
+    Версию увеличивает invalidate_membership() после коммита записи,
+    поэтому запись, сохранённая медленным чтением, которое началось до
+    этой записи, не совпадёт с текущей версией и будет перезагружена.
+    """
+    version_key = _version_key(user_id)
+    cached = cache.get_many([version_key, _cache_key(user_id)])
+    version = cached.get(version_key)
+    if version is None:
+        cache.add(version_key, _new_version(), timeout=None)
+        version = cache.get(version_key)
+    entry = cached.get(_cache_key(user_id))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    membership = UserMembership.load(user_id)
+    cache.set(_cache_key(user_id), (version, membership),
+              timeout=settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return membership
+
+
+def invalidate_membership(user_id):
+    cache = _shared_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), _new_version(), timeout=None)
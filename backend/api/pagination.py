@@ -1,7 +1,147 @@
+import base64
+import binascii
+from collections import OrderedDict
 
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from recipes import feed
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Ниже этого числа строк оценка планировщика заменяется точным COUNT(*).
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def approximate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+
+    Небольшие выборки и другие СУБД считаются точно.
+    """
+    queryset = queryset.order_by().values('pk')
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class ApproximateCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Постраничная навигация ленты рецептов.
+
+    По умолчанию — номера страниц (?page=, ?limit=); с ?count=approx
+    общее число рецептов оценивается планировщиком вместо COUNT(*).
+    С ?cursor= (для первой страницы — пустым) включается keyset-режим:
+    следующая страница выбирается условием по (pub_date, id) и
+    индексом recipe_pub_date_id_idx, без OFFSET и без подсчёта.
+    Выдачу поиска, упорядоченную по рангу, курсор по дате не описывает,
+    поэтому ?cursor= вместе с ?search= отклоняется.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            return self.paginate_keyset(queryset, request)
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_keyset(self, queryset, request):
+        if 'rank' in queryset.query.annotations:
+            raise ValidationError({self.cursor_query_param: [
+                'Курсор не поддерживается для результатов поиска; '
+                'используйте ?page=.']})
+        self.keyset = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params[self.cursor_query_param]
+        queryset = queryset.order_by('-pub_date', '-id')
+        if cursor:
+            pub_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk),
+                pub_date__lte=pub_date,
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_page_state(self):
+        """Что, кроме самих рецептов, определяет ответ со страницей."""
+        if self.keyset:
+            return (self.has_next,)
+        return (self.page.paginator.count, self.page.has_next())
+
+    def decode_cursor(self, cursor):
+        try:
+            pub_date, pk = base64.urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            pub_date = None
+        if pub_date is None:
+            raise NotFound('Неверный курсор.')
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        return base64.urlsafe_b64encode(
+            f'{recipe.pub_date.isoformat()}|{recipe.pk}'.encode()).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(RecipePagination):
+    """Лента подписок: всегда keyset-навигация по ?cursor=."""
+
+    def paginate_feed(self, user, request):
+        self.keyset = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        before = self.decode_cursor(cursor) if cursor else None
+        page = feed.read(user.pk, page_size + 1, before)
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
@@ -1,10 +1,20 @@
+import base64
+import binascii
+from collections import defaultdict
+from contextlib import contextmanager
+
+from api.instrumentation import TimedSerializerMixin
+from api.membership import get_membership
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from recipes.images import (InvalidImage, rendition_name, save_original,
+                            verify_image)
 from recipes.models import (FavoriteList, Ingredient, IngredientsRecipe,
                             Recipe, ShoppingList, Tag)
 from rest_framework import serializers
-from users.models import Follow
+from tasks.models import Task
 
 User = get_user_model()
 
@@ -22,7 +32,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор для просмотра профиля."""
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed')
@@ -34,53 +44,46 @@ class CustomUserSerializer(UserSerializer):
         read_only_fields = 'is_subscribed ',
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Follow.objects.filter(user=user, author=obj.id).exists()
-        return False
-
-
-class FollowSerializer(serializers.ModelSerializer):
-    """Сериализатор для просмотра списка подписок."""
-    recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
-    id = serializers.ReadOnlyField(source='author.id')
-    email = serializers.ReadOnlyField(source='author.email')
-    username = serializers.ReadOnlyField(source='author.username')
-    first_name = serializers.ReadOnlyField(source='author.first_name')
-    last_name = serializers.ReadOnlyField(source='author.last_name')
-    is_subscribed = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Follow
-        fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'recipes', 'recipes_count')
-
-    def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author).exists()
+        membership = get_membership(self.context.get('request'))
+        return membership is not None and obj.pk in membership.following
+
+
+class SubscriptionSerializer(CustomUserSerializer):
+    """Сериализатор автора в списке подписок."""
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
+
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + ('recipes',
+                                                     'recipes_count')
+
+    @staticmethod
+    def attach_recipes(authors, limit=None):
+        """Загружает последние limit рецептов всех авторов одним запросом
+        и сохраняет их в author.subscription_recipes."""
+        recipes = Recipe.objects.latest_per_author(
+            [author.pk for author in authors], limit
+        ).prefetch_related('tags')
+        by_author = defaultdict(list)
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.subscription_recipes = by_author[author.pk]
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return ShortRecipeSerializer(queryset, many=True,
-                                     context={'request': request}).data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return ShortRecipeSerializer(obj.subscription_recipes, many=True,
+                                     context=self.context).data
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для просмотра ингредиентов."""
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'unit',)
 
 
-class TagSerializer (serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для создания, просмотра и обновления тегов."""
     class Meta:
         model = Tag
@@ -89,10 +92,9 @@ class TagSerializer (serializers.ModelSerializer):
 
 class IngredientsRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для просмотра и обновления ингредиентов."""
-    id = serializers.IntegerField(source='id')
-    name = serializers.SerializerMethodField(source='ingredient.name',
-                                             read_only=True)
-    unit = serializers.CharField(source='ingredient.unit', read_only=True)
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    unit = serializers.ReadOnlyField(source='ingredient.unit')
 
     class Meta:
         model = IngredientsRecipe
@@ -104,82 +106,210 @@ class IngredientsRecipeSerializer(serializers.ModelSerializer):
         )
 
     def validate_amount(self, value):
-        if value < 0:
+        if value < 1:
             raise serializers.ValidationError(
                 'Проверьте что количество ингредиентов больше 0!'
             )
         return value
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для создания, просмотра и обновления рецептов."""
-    author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField(required=False, allow_null=True)
-    ingredients = IngredientsRecipeSerializer(many=True)
-    tags = TagSerializer(many=True)
+class RecipeImageField(serializers.ImageField):
+    """Изображение рецепта в base64.
 
-    class Meta:
-        model = Recipe
-        fields = (
-            'id', 'author', 'title', 'image',
-            'description', 'ingredients', 'tags',
-            'time', 'pub_date')
+    При записи изображение только проверяется: поле возвращает байты,
+    а сохраняет их RecipeSerializer вместе с рецептом. Варианты строит
+    фоновая задача recipes.image_renditions; при
+    чтении отдаётся URL варианта rendition (его можно переопределить
+    ключом image_rendition в контексте).
+    """
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return FavoriteList.objects.filter(recipe=obj,
-                                           user=request.user).exists()
+    def __init__(self, *args, rendition='full', **kwargs):
+        self.rendition = rendition
+        super().__init__(*args, **kwargs)
 
-    def get_is_in_shopping_cart(self, obj):
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            raise serializers.ValidationError(
+                'Ожидается изображение в base64.')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError(
+                'Загрузите корректное изображение.')
+        try:
+            verify_image(raw)
+        except InvalidImage as error:
+            raise serializers.ValidationError(str(error))
+        return raw
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        rendition = self.context.get('image_rendition', self.rendition)
+        url = value.storage.url(rendition_name(value.name, rendition))
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingList.objects.filter(recipe=obj,
-                                           user=request.user).exists()
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
 
-    def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
 
-        recipe = Recipe.objects.create(**validated_data)
+class TagsField(serializers.Field):
+    """Теги рецепта: на запись — список id, на чтение — объекты тегов."""
 
-        for ingredient_data in ingredients_data:
-            IngredientsRecipe.objects.create(recipe=recipe, **ingredient_data)
+    def to_representation(self, value):
+        return TagSerializer(value.all(), many=True).data
 
-        for tag_data in tags_data:
-            tag, _ = Tag.objects.get_or_create(**tag_data)
-            recipe.tags.add(tag)
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not all(
+                isinstance(tag_id, int) for tag_id in data):
+            raise serializers.ValidationError('Ожидается список id тегов.')
+        tags = list(Tag.objects.filter(pk__in=set(data)))
+        if len(tags) != len(set(data)):
+            raise serializers.ValidationError('Тег не найден.')
+        return tags
 
-        return recipe
 
-    def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Сериализатор для создания, просмотра и обновления рецептов."""
+    author = CustomUserSerializer(read_only=True)
+    image = RecipeImageField(required=False, allow_null=True)
+    ingredients = IngredientsRecipeSerializer(many=True,
+                                              source='recipe_ingredients')
+    tags = TagsField()
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
 
-        instance.title = validated_data.get('title', instance.title)
-        instance.image = validated_data.get('image', instance.image)
-        instance.description = validated_data.get('image',
-                                                  instance.description)
-        instance.time = validated_data.get('time', instance.time)
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'author', 'title', 'image',
+            'description', 'ingredients', 'tags',
+            'time', 'pub_date', 'is_favorited', 'is_in_shopping_cart')
 
-        instance.save()
+    def get_is_favorited(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return membership is not None and obj.pk in membership.favorites
 
-        instance.ingredients.all().delete()
-        for ingredient_data in ingredients_data:
-            IngredientsRecipe.objects.create(recipe=instance,
-                                             **ingredient_data)
+    def get_is_in_shopping_cart(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return membership is not None and obj.pk in membership.cart
 
-        instance.tags.clear()
-        for tag_data in tags_data:
-            tag, _ = Tag.objects.get_or_create(**tag_data)
-            instance.tags.add(tag)
+    def validate_ingredients(self, value):
+        ids = [item['ingredient_id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.')
+        found = Ingredient.objects.filter(pk__in=ids).count()
+        if found != len(ids):
+            raise serializers.ValidationError('Ингредиент не найден.')
+        return value
 
-        return instance
+    @contextmanager
+    def saved_image(self, validated_data):
+        """Сохраняет загруженное изображение перед записью рецепта.
+
+        Файл, который создал этот запрос, удаляется, если рецепт
+        сохранить не удалось: иначе на него никто не будет ссылаться.
+        """
+        raw = validated_data.get('image')
+        if not isinstance(raw, bytes):
+            yield
+            return
+        name, created = save_original(raw)
+        validated_data['image'] = name
+        try:
+            yield
+        except BaseException:
+            if created:
+                default_storage.delete(name)
+            raise
 
+    def create(self, validated_data):
+        with self.saved_image(validated_data), transaction.atomic():
+            ingredients_data = validated_data.pop('recipe_ingredients')
+            tags = validated_data.pop('tags')
+            # bulk_create не отправляет сигналы, поэтому счётчик
+            # ингредиентов задаётся сразу.
+            validated_data['ingredients_count'] = len(ingredients_data)
+            recipe = super().create(validated_data)
+            IngredientsRecipe.objects.bulk_create(
+                IngredientsRecipe(recipe=recipe, **ingredient_data)
+                for ingredient_data in ingredients_data
+            )
+            # У нового рецепта нет тегов: add() не читает текущие, как
+            # set().
+            recipe.tags.add(*tags)
+            return recipe
 
-class ShoppingListSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        with self.saved_image(validated_data), transaction.atomic():
+            ingredients_data = validated_data.pop('recipe_ingredients',
+                                                  None)
+            tags = validated_data.pop('tags', None)
+            instance = super().update(instance, validated_data)
+            if ingredients_data is not None:
+                self.update_ingredients(instance, ingredients_data)
+            if tags is not None:
+                self.update_tags(instance, tags)
+            return instance
+
+    def update_tags(self, recipe, tags):
+        """Меняет только отличающиеся теги. Текущие теги вьюсет уже
+        загрузил with_related, а set() прочитал бы их заново."""
+        current = {tag.pk for tag in recipe.tags.all()}
+        removed = current - {tag.pk for tag in tags}
+        added = [tag for tag in tags if tag.pk not in current]
+        if removed:
+            recipe.tags.remove(*removed)
+        if added:
+            recipe.tags.add(*added)
+
+    def update_ingredients(self, recipe, ingredients_data):
+        """Удаляет, изменяет и добавляет только отличающиеся строки."""
+        current = {row.ingredient_id: row
+                   for row in recipe.recipe_ingredients.all()}
+        new_amounts = {item['ingredient_id']: item['amount']
+                       for item in ingredients_data}
+        removed = [row.pk for ingredient_id, row in current.items()
+                   if ingredient_id not in new_amounts]
+        changed = []
+        added = []
+        for ingredient_id, amount in new_amounts.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                added.append(IngredientsRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount))
+            elif row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientsRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientsRecipe.objects.bulk_update(changed, ('amount',))
+        if added:
+            IngredientsRecipe.objects.bulk_create(added)
+        # updated_at рецепта уже обновил save() в update(), поисковый
+        # индекс обновит сигнал post_save рецепта после коммита.
+        if removed or added:
+            recipe.ingredients_count = len(new_amounts)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                ingredients_count=recipe.ingredients_count)
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    """Рецепт с долей ингредиентов, которые есть у пользователя."""
+    matched = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('matched', 'coverage')
+
+
+class ShoppingListSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор для списка покупок."""
     user = serializers.ReadOnlyField(source='user.username')
     recipe = RecipeSerializer()
@@ -197,7 +327,8 @@ class ShoppingListSerializer(serializers.ModelSerializer):
         return data
 
 
-class FavoriteListSerializer(serializers.ModelSerializer):
+class FavoriteListSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор для списка избранного."""
     user = serializers.ReadOnlyField(source='user.username')
     recipe = RecipeSerializer()
@@ -215,9 +346,19 @@ class FavoriteListSerializer(serializers.ModelSerializer):
         return data
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class TaskSerializer(serializers.ModelSerializer):
+    """Сериализатор состояния фоновой задачи."""
+
+    class Meta:
+        model = Task
+        fields = ('id', 'name', 'status', 'result', 'created_at',
+                  'finished_at')
+
+
+class ShortRecipeSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     """Сериализатор списка рецептов."""
-    image = Base64ImageField()
+    image = RecipeImageField(rendition='thumbnail')
 
     class Meta:
         model = Recipe
@@ -0,0 +1,30 @@
+from api.cache import ingredients_cache, tags_cache
+from api.membership import invalidate_membership
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import FavoriteList, Ingredient, ShoppingList, Tag
+from recipes.signals import ingredients_bulk_loaded
+from users.models import Follow
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    # Новая версия публикуется после коммита: иначе запрос, пришедший
+    # до коммита (например, из транзакции админки), положит в кеш под
+    # новой версией старые данные.
+    transaction.on_commit(tags_cache.invalidate)
+
+
+@receiver(ingredients_bulk_loaded, sender=Ingredient)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients_cache(sender, **kwargs):
+    transaction.on_commit(ingredients_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=FavoriteList)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_membership(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_membership(user_id))
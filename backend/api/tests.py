@@ -0,0 +1,754 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from api.cache import ingredients_cache
+from api.instrumentation import QueryBudgetExceeded
+from api.membership import UserMembership, get_membership
+from api.views import RecipeViewSet
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from foodgram_backend.db import ReplicaRouter
+from PIL import Image
+from recipes import feed, trending
+from recipes.counters import change_counter
+from recipes.management.commands.explain_hot_queries import full_scan_tables
+from recipes.models import (FavoriteList, FeedEntry, Ingredient,
+                            IngredientsRecipe, Recipe, RecipeScore,
+                            ShoppingList, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from users.models import Follow, User
+
+
+class RecipeDataMixin:
+    """Авторы, рецепты с тегами и ингредиентами, избранное, корзина и
+    подписки пользователя reader."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader',
+                                       email='reader@example.com')
+        cls.authors = [
+            User.objects.create(username=f'author{number}',
+                                email=f'author{number}@example.com')
+            for number in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}',
+                               color=f'#00000{number}')
+            for number in range(3)
+        ]
+        ingredients = [Ingredient.objects.create(name=f'Продукт {number}',
+                                                 unit='г')
+                       for number in range(4)]
+        cls.recipes = []
+        for number in range(8):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 3], title=f'Рецепт {number}',
+                description='Описание', time=5)
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            for ingredient in ingredients[:number % 4 + 1]:
+                IngredientsRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            if number % 2:
+                FavoriteList.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                ShoppingList.objects.create(user=cls.user, recipe=recipe)
+            cls.recipes.append(recipe)
+        Recipe.objects.ingredients_changed()
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        # Общий кеш (справочники, множества membership) пуст перед
+        # каждым тестом: число запросов не зависит от порядка тестов.
+        caches['default'].clear()
+
+    def get(self, path, params=None):
+        response = self.client.get(path, params or {},
+                                   HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200, getattr(
+            response, 'data', None))
+        return response
+
+
+class QueryCountTests(RecipeDataMixin, APITestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    def assert_queries(self, count, path, page_params):
+        for params in page_params:
+            with self.subTest(params=params):
+                caches['default'].clear()
+                with self.assertNumQueries(count):
+                    self.get(path, params)
+
+    def test_recipe_list_anonymous(self):
+        # Страница, COUNT(*), теги, ингредиенты.
+        self.assert_queries(4, '/api/recipes/',
+                            ({'limit': 1}, {'limit': 8}))
+
+    def test_recipe_list_authenticated(self):
+        # Плюс избранное, корзина и подписки пользователя.
+        self.client.force_authenticate(self.user)
+        self.assert_queries(7, '/api/recipes/',
+                            ({'limit': 1}, {'limit': 8}))
+
+    def test_recipe_detail(self):
+        for recipe in (self.recipes[0], self.recipes[-1]):
+            with self.subTest(recipe=recipe.pk):
+                with self.assertNumQueries(4):
+                    self.get(f'/api/recipes/{recipe.pk}/')
+        self.client.force_authenticate(self.user)
+        caches['default'].clear()
+        with self.assertNumQueries(7):
+            self.get(f'/api/recipes/{self.recipes[-1].pk}/')
+
+    def test_favorited_recipes(self):
+        self.client.force_authenticate(self.user)
+        self.assert_queries(7, '/api/recipes/', (
+            {'is_favorited': 1, 'limit': 1},
+            {'is_favorited': 1, 'limit': 8},
+        ))
+
+    def test_subscriptions(self):
+        # Авторы, COUNT(*), рецепты авторов одним запросом, их теги и
+        # подписки пользователя.
+        self.client.force_authenticate(self.user)
+        self.assert_queries(7, '/api/users/subscriptions/', (
+            {'limit': 1, 'recipes_limit': 1},
+            {'limit': 8, 'recipes_limit': 8},
+        ))
+
+
+class ReferenceCacheTests(RecipeDataMixin, APITestCase):
+    """Кеш справочников: 304 по ETag и сброс после коммита."""
+
+    def test_not_modified(self):
+        etag = self.get('/api/tags/')['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        # Сравнение слабое: подходит и ETag без W/ (и с ним, если его
+        # добавил gzip в nginx).
+        for if_none_match in (etag, etag[2:], f'"other", {etag}'):
+            with self.subTest(if_none_match=if_none_match):
+                response = self.client.get(
+                    '/api/tags/', HTTP_HOST='localhost',
+                    HTTP_IF_NONE_MATCH=if_none_match)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_invalidated_on_commit(self):
+        etag = self.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Tag.objects.create(name='Новый', slug='new', color='#ffffff')
+            self.assertEqual(self.get('/api/tags/')['ETag'], etag)
+        self.assertTrue(callbacks)
+        self.assertNotEqual(self.get('/api/tags/')['ETag'], etag)
+
+
+class RecipeConditionalTests(RecipeDataMixin, APITestCase):
+    """ETag рецептов: 304, смена после изменений и Cache-Control."""
+
+    def etag(self, path):
+        return self.get(path)['ETag']
+
+    def authenticate(self):
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_not_modified(self):
+        self.authenticate()
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipes[0].pk}/'):
+            with self.subTest(path=path):
+                etag = self.etag(path)
+                response = self.client.get(path, HTTP_HOST='localhost',
+                                           HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes(self):
+        self.authenticate()
+        # Новый рецепт, не в избранном: попадает на первую страницу.
+        recipe = self.recipes[6]
+        path = f'/api/recipes/{recipe.pk}/'
+        ingredient = Ingredient.objects.create(name='Новый', unit='г')
+
+        def edit():
+            recipe.title = 'Новое название'
+            recipe.save()
+
+        def toggle_favorite():
+            self.client.post(f'{path}add_favorites/', HTTP_HOST='localhost')
+
+        def change_ingredients():
+            IngredientsRecipe.objects.create(recipe=recipe,
+                                             ingredient=ingredient,
+                                             amount=1)
+            Recipe.objects.filter(pk=recipe.pk).ingredients_changed()
+
+        for change in (edit, toggle_favorite, change_ingredients):
+            with self.subTest(change=change.__name__):
+                etags = (self.etag(path), self.etag('/api/recipes/'))
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                self.assertNotEqual(etags[0], self.etag(path))
+                self.assertNotEqual(etags[1], self.etag('/api/recipes/'))
+
+    def test_cache_control(self):
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        for authenticated in (False, True):
+            if authenticated:
+                self.authenticate()
+            for url in (path, '/api/recipes/'):
+                with self.subTest(url=url, authenticated=authenticated):
+                    response = self.get(url)
+                    directives = {
+                        directive.strip() for directive in
+                        response['Cache-Control'].split(',')}
+                    self.assertIn('Authorization', response['Vary'])
+                    if authenticated:
+                        self.assertEqual(directives, {'private', 'no-cache'})
+                    else:
+                        self.assertEqual(directives, {
+                            'public',
+                            f'max-age={settings.RECIPES_CACHE_MAX_AGE}'})
+
+
+class CookableTests(RecipeDataMixin, APITestCase):
+    """Что приготовить: matched, coverage, порог и порядок, ошибки
+    ввода."""
+    path = '/api/recipes/cookable/'
+
+    def setUp(self):
+        super().setUp()
+        ingredients = Ingredient.objects.order_by('pk')
+        self.have = ','.join(str(ingredient.pk)
+                             for ingredient in ingredients[:2])
+
+    def cookable(self, min_coverage):
+        results = self.get(self.path, {
+            'ingredients': self.have, 'min_coverage': min_coverage,
+            'limit': 8}).data['results']
+        return [(recipe['id'], recipe['matched'],
+                 round(recipe['coverage'], 2)) for recipe in results]
+
+    def expected(self, *rows):
+        return [(self.recipes[number].pk, matched, coverage)
+                for number, matched, coverage in rows]
+
+    def test_coverage_and_order(self):
+        # У рецепта number первые number % 4 + 1 ингредиентов.
+        self.assertEqual(self.cookable(0), self.expected(
+            (5, 2, 1.0), (1, 2, 1.0), (4, 1, 1.0), (0, 1, 1.0),
+            (6, 2, 0.67), (2, 2, 0.67), (7, 2, 0.5), (3, 2, 0.5)))
+
+    def test_min_coverage(self):
+        self.assertEqual(self.cookable(0.6), self.expected(
+            (5, 2, 1.0), (1, 2, 1.0), (4, 1, 1.0), (0, 1, 1.0),
+            (6, 2, 0.67), (2, 2, 0.67)))
+        self.assertEqual(self.cookable(1), self.cookable(0.7))
+
+    @override_settings(COOKABLE_MAX_INGREDIENTS=3)
+    def test_bad_request(self):
+        for params in ({}, {'ingredients': ','}, {'ingredients': 'соль'},
+                       {'ingredients': '1', 'min_coverage': 'много'},
+                       {'ingredients': '1', 'min_coverage': '1.5'},
+                       {'ingredients': '1', 'min_coverage': '-0.1'},
+                       {'ingredients': '1,2,3,4'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.path, params,
+                                           HTTP_HOST='localhost')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TASKS_EAGER=False)
+class RecipeWriteQueriesTests(APITestCase):
+    """Запросы при создании и изменении рецепта с 20 ингредиентами и
+    3 тегами не зависят от их числа (ответ включён).
+
+    Точки сохранения не считаются: их добавляет транзакция TestCase, в
+    рабочем запросе вместо них BEGIN и COMMIT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.tag_ids = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}',
+                               color=f'#00000{number}').pk
+            for number in range(3)
+        ]
+        cls.ingredient_ids = [
+            Ingredient.objects.create(name=f'Продукт {number}', unit='г').pk
+            for number in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def write(self, method, path, ingredient_ids, amount, tag_ids=None):
+        data = {
+            'title': 'Рецепт', 'description': 'Описание', 'time': 5,
+            'tags': tag_ids or self.tag_ids,
+            'ingredients': [{'id': pk, 'amount': amount}
+                            for pk in ingredient_ids],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                path, data, format='json', HTTP_HOST='localhost')
+        self.assertIn(response.status_code, (200, 201), response.data)
+        return response, sum('SAVEPOINT' not in query['sql']
+                             for query in queries.captured_queries)
+
+    def test_create_and_update(self):
+        response, count = self.write('post', '/api/recipes/',
+                                     self.ingredient_ids[:20], 10)
+        self.assertLessEqual(count, 11)
+        self.assertEqual(len(response.data['ingredients']), 20)
+        # 5 ингредиентов убрано, 5 добавлено, у 15 новое количество.
+        response, count = self.write(
+            'patch', f'/api/recipes/{response.data["id"]}/',
+            self.ingredient_ids[5:25], 20)
+        self.assertLessEqual(count, 16)
+        self.assertEqual(
+            sorted(item['id'] for item in response.data['ingredients']),
+            sorted(self.ingredient_ids[5:25]))
+        tag_ids = [self.tag_ids[2], Tag.objects.create(
+            name='Ещё', slug='more', color='#ffffff').pk]
+        response, _ = self.write(
+            'patch', f'/api/recipes/{response.data["id"]}/',
+            self.ingredient_ids[5:25], 20, tag_ids)
+        self.assertEqual(sorted(tag['id'] for tag in response.data['tags']),
+                         sorted(tag_ids))
+
+
+class RecipeImageUploadTests(APITestCase):
+    """Исходное изображение не остаётся в хранилище, если рецепт не
+    сохранился."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.tag = Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        cls.ingredient = Ingredient.objects.create(name='Продукт', unit='г')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, TASKS_EAGER=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_root = media_root
+        self.client.force_authenticate(self.author)
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root)
+                for name in names]
+
+    def create(self, ingredient_id):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        return self.client.post('/api/recipes/', {
+            'title': 'Рецепт', 'description': 'Описание', 'time': 5,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': ingredient_id, 'amount': 1}],
+            'image': f'data:image/png;base64,{image}',
+        }, format='json', HTTP_HOST='localhost')
+
+    def test_invalid_recipe(self):
+        response = self.create(ingredient_id=self.ingredient.pk + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_failed_write(self):
+        with mock.patch.object(IngredientsRecipe.objects, 'bulk_create',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.create(self.ingredient.pk)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_saved_with_recipe(self):
+        response = self.create(self.ingredient.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stored_files(), ['original.png'])
+
+
+class IngredientAutocompleteTests(APITestCase):
+    """Автодополнение ингредиентов: порядок, limit вместе с другими
+    фильтрами и перестройка индекса по общей версии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('salt', 'salted butter', 'sea salt', 'basalt', 'sugar'):
+            Ingredient.objects.create(name=name, unit='g')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def names(self, **params):
+        response = self.client.get('/api/ingredients/', params,
+                                   HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    @override_settings(INGREDIENTS_AUTOCOMPLETE_LIMIT=3)
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.names(name='sal'),
+                         ['salt', 'salted butter', 'basalt'])
+
+    @override_settings(INGREDIENTS_AUTOCOMPLETE_LIMIT=1)
+    def test_limit_applies_after_other_filters(self):
+        self.assertEqual(self.names(name='sal', contain_name='sea'),
+                         ['sea salt'])
+        self.assertEqual(self.names(name='salt', start_name='ba'),
+                         ['basalt'])
+
+    @override_settings(REFERENCE_CACHE_VERSION_TTL=0)
+    def test_index_follows_shared_version(self):
+        self.assertEqual(self.names(name='pep'), [])
+        # Загрузка в другом процессе: сигналы этого процесса не
+        # срабатывают, меняется только версия в общем кеше.
+        Ingredient.objects.bulk_create([Ingredient(name='pepper', unit='g')])
+        caches['default'].incr(ingredients_cache.version_key)
+        self.assertEqual(self.names(name='pep'), ['pepper'])
+
+
+class MembershipCacheTests(RecipeDataMixin, APITestCase):
+    """Флаги пользователя берутся из кеша и сбрасываются после коммита."""
+
+    def test_favorite_invalidates_membership(self):
+        self.client.force_authenticate(self.user)
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        self.assertFalse(self.get(path).data['is_favorited'])
+        with self.assertNumQueries(4):
+            self.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{path}add_favorites/', HTTP_HOST='localhost')
+        self.assertTrue(self.get(path).data['is_favorited'])
+
+    def membership(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return get_membership(request)
+
+    def test_slow_reader_does_not_overwrite(self):
+        recipe = self.recipes[0]
+        load = UserMembership.load
+
+        def slow_load(user_id):
+            # Запись коммитится, пока чтение ещё не сохранило результат.
+            membership = load(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                FavoriteList.objects.create(user=self.user, recipe=recipe)
+            return membership
+
+        with mock.patch.object(UserMembership, 'load', slow_load):
+            self.assertNotIn(recipe.pk, self.membership().favorites)
+        self.assertIn(recipe.pk, self.membership().favorites)
+
+    def test_loaded_from_primary(self):
+        with mock.patch.object(ReplicaRouter, 'db_for_read',
+                               return_value='lagging_replica'):
+            self.assertIn(self.recipes[1].pk, self.membership().favorites)
+
+
+class CounterFieldsTests(RecipeDataMixin, APITestCase):
+    """Полное сохранение устаревшего объекта не затирает счётчики."""
+
+    def test_stale_recipe_save(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        FavoriteList.objects.create(user=self.authors[0], recipe=recipe)
+        recipe.title = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.ingredients_count, 1)
+
+    def test_stale_user_save(self):
+        author = User.objects.get(pk=self.authors[2].pk)
+        Follow.objects.create(user=self.authors[0], author=author)
+        author.first_name = 'Имя'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Имя')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 2)
+
+    def test_change_returns_values(self):
+        author = self.authors[2]
+        self.assertEqual(
+            change_counter(User, author.pk, 'followers_count', 2), (0, 2))
+        self.assertEqual(
+            change_counter(User, author.pk, 'followers_count', -1), (2, 1))
+        self.assertEqual(
+            change_counter(User, author.pk, 'followers_count', -1), (1, 0))
+        self.assertIsNone(
+            change_counter(User, author.pk, 'followers_count', -1))
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+
+
+class RecipePaginationTests(RecipeDataMixin, APITestCase):
+
+    def test_cursor_pages(self):
+        response = self.get('/api/recipes/', {'cursor': '', 'limit': 5})
+        ids = [recipe['id'] for recipe in response.data['results']]
+        response = self.client.get(response.data['next'],
+                                   HTTP_HOST='localhost')
+        ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, [recipe.pk for recipe in self.recipes[::-1]])
+
+    def test_cursor_rejected_for_search(self):
+        response = self.client.get('/api/recipes/',
+                                   {'search': 'Рецепт', 'cursor': ''},
+                                   HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+
+class QueryPlanTests(RecipeDataMixin, APITestCase):
+    """Фильтры списка рецептов читают таблицы по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Recipe.objects.bulk_create(
+            Recipe(author=cls.authors[number % 3], title=f'Блюдо {number}',
+                   description='Описание', time=5)
+            for number in range(300)
+        )
+        recipe_ids = Recipe.objects.filter(
+            title__startswith='Блюдо').values_list('pk', flat=True)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id,
+                                tag_id=cls.tags[recipe_id % 3].pk)
+            for recipe_id in recipe_ids
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # На тестовых объёмах полное чтение дешевле любого индекса;
+            # проверяется, что подходящий индекс есть и применим.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertEqual(full_scan_tables(connection.vendor, plan) or [],
+                         [], plan)
+        return plan
+
+    def test_author_and_tags_filter(self):
+        plan = self.explain(Recipe.objects.filter(
+            author=self.authors[0]).with_any_tag(self.tags[:1]).order_by(
+                '-pub_date', '-id')[:6])
+        self.assertIn('recipe_author_pub_date_idx', plan)
+
+    def test_tags_filter(self):
+        self.explain(Recipe.objects.with_any_tag(self.tags[:1]).order_by(
+            '-pub_date', '-id')[:6])
+
+    def test_recipes_of_tag(self):
+        # Выборка от тега — индекс (tag_id, recipe_id) из миграции 0009.
+        # PostgreSQL может взять и индекс внешнего ключа tag_id.
+        plan = self.explain(Recipe.tags.through.objects.filter(
+            tag=self.tags[0]).values('recipe_id'))
+        if connection.vendor == 'sqlite':
+            self.assertIn('recipes_recipe_tags_tag_recipe_idx', plan)
+        else:
+            self.assertIn('recipes_recipe_tags_tag_', plan)
+
+
+class RecipeIngredientsTests(RecipeDataMixin, APITestCase):
+    """Изменение ингредиентов рецепта через API."""
+
+    def test_update_ingredients(self):
+        recipe = self.recipes[3]
+        self.client.force_authenticate(recipe.author)
+        path = f'/api/recipes/{recipe.pk}/'
+        etag = self.get(path)['ETag']
+        ingredient = Ingredient.objects.order_by('pk').last()
+        response = self.client.patch(
+            path, {'ingredients': [{'id': ingredient.pk, 'amount': 5}]},
+            format='json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200, getattr(
+            response, 'data', None))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 1)
+        self.assertNotEqual(self.get(path)['ETag'], etag)
+
+    def test_delete_recipe(self):
+        recipe = self.recipes[3]
+        self.client.force_authenticate(recipe.author)
+        response = self.client.delete(f'/api/recipes/{recipe.pk}/',
+                                      HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            IngredientsRecipe.objects.filter(recipe=recipe.pk).exists())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(RecipeDataMixin, APITestCase):
+    """Эндпоинты с query_budgets укладываются в бюджет: при
+    QUERY_BUDGET_STRICT превышение — исключение QueryBudgetExceeded."""
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def read(self, path, params=None):
+        response = self.get(path, params)
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_reference_endpoints(self):
+        tag = self.tags[0]
+        ingredient = Ingredient.objects.first()
+        for path in ('/api/tags/', f'/api/tags/{tag.pk}/',
+                     '/api/ingredients/', f'/api/ingredients/{ingredient.pk}/',
+                     '/api/ingredients/?name=Прод'):
+            with self.subTest(path=path):
+                self.read(path)
+
+    def test_recipe_endpoints(self):
+        ingredients = ','.join(
+            map(str, Ingredient.objects.values_list('pk', flat=True)))
+        for path in ('/api/recipes/', '/api/recipes/?limit=8&tags=tag-1',
+                     f'/api/recipes/?author={self.authors[0].pk}',
+                     '/api/recipes/?is_favorited=1&is_in_shopping_cart=1',
+                     f'/api/recipes/{self.recipes[0].pk}/',
+                     f'/api/recipes/cookable/?ingredients={ingredients}',
+                     '/api/recipes/trending/'):
+            with self.subTest(path=path):
+                self.read(path)
+
+    def test_user_endpoints(self):
+        for path in ('/api/users/', f'/api/users/{self.authors[0].pk}/',
+                     '/api/users/me/', '/api/users/subscriptions/',
+                     '/api/users/feed/'):
+            with self.subTest(path=path):
+                self.read(path)
+
+    def test_download_shopping_cart(self):
+        file_types = ['txt', 'csv']
+        if os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+            file_types.append('pdf')
+        for file_type in file_types:
+            with self.subTest(file_type=file_type):
+                self.read('/api/recipes/download_shopping_cart/',
+                          {'type': file_type})
+
+    def test_streaming_body_counted(self):
+        budgets = {**RecipeViewSet.query_budgets,
+                   'download_shopping_cart': 1}
+        with mock.patch.object(RecipeViewSet, 'query_budgets', budgets):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.read('/api/recipes/download_shopping_cart/')
+
+
+@override_settings(FEED_MAX_ENTRIES=3, FEED_FANOUT_MAX_FOLLOWERS=2,
+                   TASKS_EAGER=True)
+class FeedTests(RecipeDataMixin, APITestCase):
+    """Ленты подписок: пересборка, раскладка с обрезкой и автор, который
+    опустился ниже порога раскладки."""
+
+    def feed_ids(self):
+        return list(FeedEntry.objects.filter(user=self.user).order_by(
+            '-pub_date', '-recipe_id').values_list('recipe_id', flat=True))
+
+    def latest(self, *authors):
+        return [recipe.pk for recipe in self.recipes[::-1]
+                if recipe.author in authors][:3]
+
+    def test_rebuild(self):
+        feed.rebuild([self.user.pk, self.authors[0].pk])
+        self.assertEqual(self.feed_ids(),
+                         self.latest(*self.authors[:2]))
+        self.assertFalse(FeedEntry.objects.filter(user=self.authors[0]))
+
+    def test_fan_out_trims_full_feeds(self):
+        feed.rebuild([self.user.pk])
+        recipe = Recipe.objects.create(author=self.authors[1], title='Новый',
+                                       description='Описание', time=5)
+        self.assertEqual(self.feed_ids(),
+                         [recipe.pk, *self.latest(*self.authors[:2])[:2]])
+
+    def test_author_below_threshold(self):
+        author = self.authors[2]
+        Follow.objects.create(user=self.user, author=author)
+        follow = Follow.objects.create(user=self.authors[0], author=author)
+        feed.rebuild([self.user.pk])
+        self.assertEqual(self.feed_ids(),
+                         self.latest(*self.authors[:2]))
+        follow.delete()
+        self.assertEqual(self.feed_ids(), self.latest(*self.authors))
+
+    def test_concurrent_unfollows_rebuild_once(self):
+        # Вторая отписка уменьшает счётчик сразу после первой, раньше,
+        # чем первая успевает проверить порог: счётчик проходит 2 -> 0,
+        # но пересечение порога всё равно замечено ровно один раз.
+        author = self.authors[2]
+        first, second = [Follow.objects.create(user=user, author=author)
+                         for user in (self.user, self.authors[0])]
+        rivals = [second]
+
+        def rival_unfollow(*args):
+            change = change_counter(*args)
+            if rivals:
+                rivals.pop().delete()
+            return change
+
+        with mock.patch('recipes.signals.enqueue') as enqueue, \
+                mock.patch('recipes.signals.change_counter', rival_unfollow):
+            first.delete()
+        enqueue.assert_called_once_with('recipes.feed_rebuild_author',
+                                        {'author_id': author.pk})
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+
+
+class TrendingTests(RecipeDataMixin, APITestCase):
+    """Счёт популярности: удаление вычитает затухший вклад, rebuild
+    совпадает с накопленным сигналами."""
+
+    def score(self, recipe, now):
+        score, decayed_at = RecipeScore.objects.values_list(
+            'score', 'decayed_at').get(recipe=recipe)
+        return score / trending.growth(decayed_at, now)
+
+    def test_removal_after_decay(self):
+        recipe = self.recipes[0]
+        added_at = timezone.now()
+        later = added_at + timedelta(
+            hours=settings.TRENDING_HALF_LIFE_HOURS)
+        trending.add(recipe.pk, 1.0, added_at)
+        trending.decay(later)
+        trending.add(recipe.pk, 1.0, later)
+        trending.add(recipe.pk, -1.0, added_at)
+        self.assertAlmostEqual(self.score(recipe, later), 1.0)
+
+    def test_rebuild_matches_signals(self):
+        now = timezone.now()
+        scores = {recipe_id: self.score(recipe_id, now)
+                  for recipe_id in RecipeScore.objects.values_list(
+                      'recipe_id', flat=True)}
+        trending.rebuild()
+        self.assertEqual(scores.keys(), set(RecipeScore.objects.values_list(
+            'recipe_id', flat=True)))
+        for recipe_id, score in scores.items():
+            self.assertAlmostEqual(self.score(recipe_id, now), score)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientsViewSet, RecipeViewSet, TagsViewSet
+from .views import (IngredientsViewSet, RecipeViewSet, TagsViewSet,
+                    health_live, health_ready, metrics, task_detail)
 
 app_name = 'api'
 
@@ -14,4 +15,8 @@ router.register('ingredients', IngredientsViewSet, basename='ingredients')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('tasks/<int:task_id>/', task_detail, name='task-detail'),
+    path('health/live/', health_live, name='health-live'),
+    path('health/ready/', health_ready, name='health-ready'),
+    path('metrics/', metrics, name='metrics'),
 ]
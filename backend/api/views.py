@@ -1,58 +1,217 @@
-from api.filters import IngredientFilter
+from api.cache import ingredients_cache, tags_cache
+from api.conditional import (VERSION_FIELDS, CacheControlMixin,
+                             ReferenceCacheMixin, conditional_response,
+                             patch_api_cache_control)
+from api.filters import IngredientFilter, RecipeFilter
+from api.instrumentation import registry
+from api.membership import UserMembership, set_membership
+from api.pagination import LimitPageNumberPagination, RecipePagination
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
-from api.serializers import (FavoriteListSerializer, IngredientSerializer,
-                             RecipeSerializer, ShoppingListSerializer,
-                             ShortRecipeSerializer, TagSerializer)
+from api.serializers import (CookableRecipeSerializer, FavoriteListSerializer,
+                             IngredientSerializer, RecipeSerializer,
+                             ShoppingListSerializer, ShortRecipeSerializer,
+                             TagSerializer, TaskSerializer)
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from recipes.models import FavoriteList, Ingredient, Recipe, ShoppingList, Tag
-from recipes.utils import remove_recipe_from_favorites
+from recipes.utils import (SHOPPING_LIST_FORMATS, create_shopping_list_report,
+                           remove_recipe_from_favorites)
 from rest_framework import status, viewsets
-from rest_framework.decorators import action, api_view
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import (action, api_view,
+                                       authentication_classes,
+                                       permission_classes)
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from tasks.models import Task
+from tasks.queue import enqueue
 from users.models import User
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CacheControlMixin, ReferenceCacheMixin,
+                         viewsets.ModelViewSet):
     """Вьюсет для модели ингредиента."""
+    cache_max_age = settings.REFERENCE_CACHE_MAX_AGE
+    reference_cache = ingredients_cache
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    # Токен, ingredient_index при первом ?name= и ингредиенты по его id.
+    query_budgets = {'list': 3, 'retrieve': 2}
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class TagsViewSet(CacheControlMixin, ReferenceCacheMixin,
+                  viewsets.ModelViewSet):
     """Вьюсет для модели тега."""
+    cache_max_age = settings.REFERENCE_CACHE_MAX_AGE
+    reference_cache = tags_cache
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
 @api_view(['GET'])
 def recipe_detail(request, recipe_id):
     """Страница с полным описанием рецепта."""
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
-    serializer = RecipeSerializer(recipe)
-    return Response(serializer.data)
+    version = get_object_or_404(Recipe.objects.only(*VERSION_FIELDS),
+                                pk=recipe_id)
+
+    def respond():
+        recipe = Recipe.objects.with_related().get(pk=version.pk)
+        serializer = RecipeSerializer(recipe, context={'request': request})
+        return Response(serializer.data)
+
+    response = conditional_response(request, [version], respond)
+    patch_api_cache_control(request, response,
+                            settings.RECIPES_CACHE_MAX_AGE)
+    return response
+
 
+class RecipeViewSet(CacheControlMixin, viewsets.ModelViewSet):
+    """Вьюсет рецептов; ?search= — полнотекстовый поиск по названию,
+    описанию и ингредиентам, результаты упорядочены по рангу.
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    list и retrieve отвечают 304 по If-None-Match/If-Modified-Since
+    до сериализации.
+    """
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = RecipeFilter
+    cache_max_age = settings.RECIPES_CACHE_MAX_AGE
+    public_cache_actions = ('list', 'retrieve', 'trending')
+    # Не зависят от размера страницы: связи загружаются пачками.
+    query_budgets = {'list': 9, 'retrieve': 8, 'cookable': 8,
+                     'trending': 8, 'download_shopping_cart': 2}
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_related()
+        search = self.request.query_params.get('search', '').strip()
+        if search and self.action == 'list':
+            queryset = queryset.search(search)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'cookable', 'trending'):
+            context['image_rendition'] = 'thumbnail'
+        return context
+
+    def list(self, request, *args, **kwargs):
+        # Теги и ингредиенты загружаются, только если ответ не 304.
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()).prefetch_related(None))
+
+        def respond():
+            prefetch_related_objects(page, *Recipe.objects.related_lookups())
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return conditional_response(request, page, respond,
+                                    *self.paginator.get_page_state())
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        version = get_object_or_404(
+            self.filter_queryset(Recipe.objects.only(*VERSION_FIELDS)),
+            pk=pk)
+        return conditional_response(
+            request, [version],
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs))
+
+    def _reload_instance(self, serializer):
+        # Ответ строится по рецепту со всеми связями, загруженными
+        # фиксированным числом запросов.
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        # Новый рецепт ещё ни у кого не в избранном и не в корзине, а на
+        # себя подписаться нельзя: флаги ответа известны без запросов.
+        set_membership(self.request, UserMembership((), (), ()))
+        self._reload_instance(serializer)
 
     def perform_update(self, serializer):
         if serializer.instance.author != self.request.user:
             raise PermissionDenied('Изменение чужого контента запрещено!')
         super(RecipeViewSet, self).perform_update(serializer)
+        self._reload_instance(serializer)
+
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """Что приготовить: ?ingredients=1,2,3&min_coverage=0.5.
+
+        Рецепты упорядочены по доле своих ингредиентов, которые есть
+        в наборе.
+        """
+        try:
+            ingredient_ids = {
+                int(value) for values in
+                request.query_params.getlist('ingredients')
+                for value in values.split(',') if value
+            }
+            min_coverage = float(request.query_params.get(
+                'min_coverage', settings.COOKABLE_MIN_COVERAGE))
+        except ValueError:
+            return Response({'errors': 'Некорректные параметры запроса'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ingredient_ids or not 0 <= min_coverage <= 1:
+            return Response({'errors': 'Укажите ингредиенты и долю '
+                                       'покрытия от 0 до 1'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ingredient_ids) > settings.COOKABLE_MAX_INGREDIENTS:
+            return Response({'errors': 'Слишком много ингредиентов'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset()).cookable(
+            ingredient_ids, min_coverage)
+        # Рецепты ранжированы по покрытию, а не по дате публикации,
+        # поэтому keyset-режим RecipePagination здесь не подходит.
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = CookableRecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """Популярные рецепты, ?limit= — сколько (по умолчанию 6).
+
+        Порядок — по счёту recipes.trending: добавления в избранное и
+        списки покупок с затуханием по времени.
+        """
+        try:
+            limit = int(request.query_params.get(
+                'limit', self.paginator.page_size))
+        except ValueError:
+            limit = self.paginator.page_size
+        limit = min(max(limit, 1), settings.TRENDING_MAX_LIMIT)
+        recipes = list(Recipe.objects.with_related().filter(
+            trending_score__score__gt=0
+        ).order_by(
+            '-trending_score__score', '-trending_score__recipe_id'
+        )[:limit])
+
+        def respond():
+            serializer = self.get_serializer(recipes, many=True)
+            return Response(serializer.data)
+
+        return conditional_response(request, recipes, respond)
 
     @action(detail=True, methods=['post', 'delete'])
     def add_favorites(self, request, pk):
@@ -95,6 +254,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Рецепт успешно удален из списка покупок'},
                         status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def download_shopping_cart(self, request):
+        """Скачать список покупок: ?type=txt (по умолчанию), csv или pdf."""
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response({'errors': 'Неподдерживаемый формат файла'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return create_shopping_list_report(
+            ShoppingList.objects.filter(user=request.user), file_type
+        )
+
+    @action(detail=False, methods=['post'],
+            permission_classes=(IsAuthenticated,))
+    def export_shopping_cart(self, request):
+        """Подготовить файл списка покупок в фоне: {"type": "pdf"}.
+
+        Ссылка на файл появится в result задачи /api/tasks/<id>/.
+        """
+        file_type = request.data.get('type', 'pdf')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response({'errors': 'Неподдерживаемый формат файла'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        task = enqueue('recipes.shopping_list_export',
+                       {'user_id': request.user.pk, 'file_type': file_type},
+                       user=request.user)
+        return Response(TaskSerializer(task).data,
+                        status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=['post'])
     def subscribe_to_author(self, request, pk=None):
         recipe = self.get_object()
@@ -108,6 +296,61 @@ class RecipeViewSet(viewsets.ModelViewSet):
                         status=status.HTTP_201_CREATED)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def task_detail(request, task_id):
+    """Состояние фоновой задачи текущего пользователя."""
+    task = get_object_or_404(Task, pk=task_id, user=request.user)
+    return Response(TaskSerializer(task).data)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_live(request):
+    """Процесс жив и обрабатывает запросы; внешние сервисы не
+    проверяются."""
+    response = Response({'status': 'ok'})
+    patch_api_cache_control(request, response)
+    return response
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_ready(request):
+    """Процесс готов принимать трафик: доступны все базы данных
+    из settings.DATABASES и кеш по умолчанию."""
+    checks = {}
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            checks[f'db:{alias}'] = 'ok'
+        except Exception as error:
+            checks[f'db:{alias}'] = type(error).__name__
+    try:
+        cache = caches['default']
+        cache.set('health:ready', 1, 5)
+        checks['cache'] = 'ok' if cache.get('health:ready') else 'miss'
+    except Exception as error:
+        checks['cache'] = type(error).__name__
+    ready = all(result == 'ok' for result in checks.values())
+    response = Response(
+        {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+        status=status.HTTP_200_OK if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE)
+    patch_api_cache_control(request, response)
+    return response
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus; nginx закрывает
+    адрес снаружи."""
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
+
+
 @api_view(['post', 'delete'])
 @login_required
 def favorites(request):
@@ -135,16 +378,15 @@ def shopping(request):
 def filtered_recipes(request, tag_slug):
     """Страница с выбранным тегом."""
     tag = get_object_or_404(Tag, slug=tag_slug)
-    filtered_recipes = Recipe.objects.filter(tags=tag)
-    tags_param = request.GET.getlist('tags')
-    if tags_param:
-        other_tags = Tag.objects.filter(slug__in=tags_param)
-        filtered_recipes = filtered_recipes | Recipe.objects.filter(
-            tags__in=other_tags)
+    tags = Tag.objects.filter(
+        slug__in=[tag.slug, *request.GET.getlist('tags')])
+    filtered_recipes = Recipe.objects.with_any_tag(tags).prefetch_related(
+        'tags')
     user_param = request.GET.get('user')
     if user_param:
         user = get_object_or_404(User, pk=user_param)
         filtered_recipes = filtered_recipes.filter(author=user)
 
-    serializer = ShortRecipeSerializer(filtered_recipes, many=True)
+    serializer = ShortRecipeSerializer(filtered_recipes, many=True,
+                                       context={'request': request})
     return Response(serializer.data)
@@ -0,0 +1,108 @@
+import hashlib
+import random
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Состояние текущего запроса: можно ли читать с реплик и была ли
+# запись в базу.
+_state = Local()
+
+
+class ConnectionHealthCheckMiddleware:
+    """Проверяет постоянные соединения с базой перед запросом.
+
+    С CONN_MAX_AGE > 0 соединение переживает запрос; если база или
+    pgbouncer за это время его закрыли, первый запрос к базе упал бы.
+    Неработающее соединение закрывается, и Django откроет новое.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.DB_HEALTH_CHECKS:
+            for connection in connections.all():
+                if (connection.connection is not None
+                        and connection.settings_dict['CONN_MAX_AGE'] != 0
+                        and not connection.in_atomic_block
+                        and not connection.is_usable()):
+                    connection.close()
+        return self.get_response(request)
+
+
+class ReplicaRouter:
+    """Чтения моделей из REPLICA_APPS — с одной из DATABASE_REPLICAS.
+
+    Реплики используются только внутри запросов, которые разрешил
+    ReplicaPinMiddleware; команды, фоновые задачи, транзакции и всё,
+    что выполняется после первой записи в запросе, читают с основной
+    базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in settings.REPLICA_APPS:
+            return None
+        if (not getattr(_state, 'replica_reads', False)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        _state.replica_reads = False
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _sticky_key(request):
+    client = (request.META.get('HTTP_AUTHORIZATION')
+              or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not client:
+        return None
+    return 'replica-pin:' + hashlib.sha256(client.encode()).hexdigest()
+
+
+class ReplicaPinMiddleware:
+    """Решает, может ли запрос читать с реплик (read-your-writes).
+
+    Изменяющие запросы (POST, PUT, PATCH, DELETE) работают только с
+    основной базой. Клиент, чей запрос что-то записал, ещё
+    REPLICA_STICKY_SECONDS читает с основной базы, пока реплики
+    догоняют её; клиент определяется по заголовку Authorization или
+    cookie сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        cache = caches[settings.REPLICA_STICKY_CACHE_ALIAS]
+        key = _sticky_key(request)
+        _state.wrote = False
+        _state.replica_reads = (request.method in SAFE_METHODS
+                                and not (key and cache.get(key)))
+        try:
+            response = self.get_response(request)
+            if key and _state.wrote:
+                cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        finally:
+            _state.replica_reads = False
+            _state.wrote = False
+        return response
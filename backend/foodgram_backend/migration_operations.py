@@ -0,0 +1,120 @@
+"""Операции миграций, которые строят индексы без блокировки записи.
+
+На PostgreSQL индекс создаётся с CONCURRENTLY, на остальных базах —
+обычным CREATE INDEX. Миграция с такими операциями должна объявлять
+atomic = False: CONCURRENTLY не работает внутри транзакции, поэтому
+миграция может остановиться между операциями. При повторном запуске
+готовые индексы и ограничения пропускаются, а индекс, оставшийся в
+состоянии INVALID, удаляется и строится заново.
+"""
+from django.contrib.postgres import operations
+from django.db import NotSupportedError
+from django.db.migrations import AddConstraint, AddIndex
+
+
+def is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def drop_invalid_index(schema_editor, name):
+    """Удаляет индекс name, оставшийся в состоянии INVALID после
+    прерванного CREATE INDEX CONCURRENTLY: IF NOT EXISTS его бы
+    пропустил, а без IF NOT EXISTS создание упало бы."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT NOT i.indisvalid FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [name])
+        row = cursor.fetchone()
+    if row and row[0]:
+        schema_editor.execute(
+            f'DROP INDEX CONCURRENTLY {schema_editor.quote_name(name)}')
+
+
+def constraint_exists(schema_editor, table, name):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_constraint c '
+            'JOIN pg_class t ON t.oid = c.conrelid '
+            'WHERE c.conname = %s AND t.relname = %s '
+            'AND pg_table_is_visible(t.oid)',
+            [name, table])
+        return cursor.fetchone() is not None
+
+
+class AddIndexConcurrently(operations.AddIndexConcurrently):
+    """Индекс с CREATE INDEX CONCURRENTLY IF NOT EXISTS: в Django 3.2
+    AddIndexConcurrently не пропускает индекс, готовый после
+    прерванного прошлого запуска."""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if is_postgresql(schema_editor):
+            self._ensure_not_in_transaction(schema_editor)
+            model = to_state.apps.get_model(app_label, self.model_name)
+            if not self.allow_migrate_model(schema_editor.connection.alias,
+                                            model):
+                return
+            drop_invalid_index(schema_editor, self.index.name)
+            statement = self.index.create_sql(model, schema_editor,
+                                              concurrently=True)
+            statement.template = statement.template.replace(
+                'CONCURRENTLY', 'CONCURRENTLY IF NOT EXISTS', 1)
+            schema_editor.execute(statement, params=None)
+            return
+        return AddIndex.database_forwards(self, app_label, schema_editor,
+                                          from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if is_postgresql(schema_editor):
+            return super().database_backwards(app_label, schema_editor,
+                                              from_state, to_state)
+        return AddIndex.database_backwards(self, app_label, schema_editor,
+                                           from_state, to_state)
+
+
+class AddUniqueConstraintConcurrently(AddConstraint):
+    """Уникальное ограничение по полям.
+
+    На PostgreSQL сначала строится уникальный индекс с CONCURRENTLY,
+    затем ограничение подключается к готовому индексу: ALTER TABLE
+    блокирует таблицу лишь на время изменения каталога. Готовый индекс
+    от прерванного прошлого запуска используется как есть, индекс в
+    состоянии INVALID строится заново, уже подключённое ограничение
+    пропускается.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not is_postgresql(schema_editor):
+            return super().database_forwards(app_label, schema_editor,
+                                             from_state, to_state)
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                'CONCURRENTLY нельзя выполнить внутри транзакции; '
+                'объявите в миграции atomic = False.')
+        constraint = self.constraint
+        if constraint.condition is not None or not constraint.fields:
+            raise NotSupportedError(
+                'Поддерживаются только ограничения по полям без условия.')
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias,
+                                        model):
+            return
+        if constraint_exists(schema_editor, model._meta.db_table,
+                             constraint.name):
+            return
+        table = schema_editor.quote_name(model._meta.db_table)
+        name = schema_editor.quote_name(constraint.name)
+        columns = ', '.join(
+            schema_editor.quote_name(model._meta.get_field(field).column)
+            for field in constraint.fields)
+        drop_invalid_index(schema_editor, constraint.name)
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON {table} ({columns})')
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} '
+            f'UNIQUE USING INDEX {name}')
@@ -9,7 +9,9 @@ SECRET_KEY = os.getenv('TOKEN', 'django-insecure-123')
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-DEBUG = True
+# В контейнере используется foodgram_backend.settings_production,
+# где DEBUG выключен всегда.
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ['51.250.22.76', '127.0.0.1', 'localhost', 'backend',]
 
@@ -29,9 +31,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'tasks.apps.TasksConfig',
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
+    'foodgram_backend.db.ConnectionHealthCheckMiddleware',
+    'foodgram_backend.db.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +66,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
+ASGI_APPLICATION = 'foodgram_backend.asgi.application'
 
 DATABASES = {
     'default': {
@@ -68,10 +75,76 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Секунды жизни соединения между запросами; 0 — новое
+        # соединение на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Для pgbouncer в режиме transaction: курсоры на стороне
+        # сервера (QuerySet.iterator()) не переживают транзакцию.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
     }
 }
 
+# Реплики для чтения: DB_REPLICAS=host1[:port],host2 для PostgreSQL
+# или пути к файлам для SQLite. Остальные параметры берутся из default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {**DATABASES['default'],
+                        'TEST': {'MIRROR': 'default'}}
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES[alias]['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias].update(HOST=host,
+                                PORT=port or DATABASES['default']['PORT'])
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram_backend.db.ReplicaRouter']
+# Приложения, модели которых читаются с реплик.
+REPLICA_APPS = ('recipes', 'users')
+# Сколько секунд после записи клиент читает с основной базы; больше
+# обычного отставания реплик. Кеш должен быть общим для всех процессов.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_STICKY_CACHE_ALIAS = os.getenv('REPLICA_STICKY_CACHE_ALIAS',
+                                       'default')
+
+# Заголовок Server-Timing с числом и временем SQL-запросов, временем
+# сериализации и ответа (api.instrumentation).
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+# Превышение query_budgets вьюсета — исключение, а не запись в лог;
+# включается в тестах.
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+# Проверка постоянных соединений перед каждым запросом
+# (foodgram_backend.db.ConnectionHealthCheckMiddleware).
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', 'True') == 'True'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+REFERENCE_CACHE_ALIAS = os.getenv('REFERENCE_CACHE_ALIAS', 'default')
+REFERENCE_CACHE_TIMEOUT = 24 * 60 * 60
+REFERENCE_CACHE_VERSION_TTL = 5
+REFERENCE_CACHE_LOCAL_SIZE = 512
+
+# Cache-Control: max-age анонимных ответов API, с.
+RECIPES_CACHE_MAX_AGE = int(os.getenv('RECIPES_CACHE_MAX_AGE', 60))
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 300))
+
+# Кеш api.membership между запросами, с; 0 — загрузка на каждый запрос.
+# Записи сбрасываются сигналами, поэтому при нескольких процессах нужен
+# общий для них бэкенд кеша (memcached, redis), а не LocMemCache.
+MEMBERSHIP_CACHE_ALIAS = os.getenv('MEMBERSHIP_CACHE_ALIAS', 'default')
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 300))
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -97,6 +170,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
@@ -135,4 +212,49 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+INGREDIENTS_AUTOCOMPLETE_LIMIT = 20
+
+# Подбор рецептов по ингредиентам (/api/recipes/cookable/).
+COOKABLE_MIN_COVERAGE = 0.5
+COOKABLE_MAX_INGREDIENTS = 100
+
+# Популярные рецепты (recipes.trending): за TRENDING_HALF_LIFE_HOURS
+# вклад добавления в избранное или список покупок уменьшается вдвое;
+# счета ниже TRENDING_MIN_SCORE удаляет manage.py decay_scores.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+TRENDING_MIN_SCORE = 0.01
+TRENDING_MAX_LIMIT = 50
+
+# Варианты изображений рецептов: название -> наибольшая сторона, px.
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': 320,
+    'card': 640,
+    'full': 1600,
+}
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', 'WEBP')
+RECIPE_IMAGE_QUALITY = 82
+RECIPE_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Фоновые задачи (приложение tasks) выполняет manage.py run_worker. С
+# TASKS_EAGER=True задачи выполняются сразу в процессе, который их
+# поставил, в том числе в потоке запроса, — по умолчанию только при
+# DEBUG, чтобы для разработки не нужен был отдельный обработчик.
+TASKS_EAGER = os.getenv('TASKS_EAGER', str(DEBUG)) == 'True'
+TASKS_VISIBILITY_TIMEOUT = int(os.getenv('TASKS_VISIBILITY_TIMEOUT', 300))
+TASKS_POLL_INTERVAL = 1
+TASKS_WORKER_CONCURRENCY = int(os.getenv('TASKS_WORKER_CONCURRENCY', 2))
+TASKS_WORKER_POOL = os.getenv('TASKS_WORKER_POOL', 'thread')
+
+# Лента подписок (recipes.feed): сколько последних рецептов хранится
+# у каждого подписчика и с какого числа подписчиков рецепты автора
+# не раскладываются по лентам, а подмешиваются при чтении.
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', 500))
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS',
+                                          10000))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
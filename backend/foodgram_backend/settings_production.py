@@ -0,0 +1,47 @@
+"""Настройки для запуска за nginx (gunicorn или uvicorn).
+
+Подключаются через DJANGO_SETTINGS_MODULE, остальное берётся из
+foodgram_backend.settings.
+"""
+import os
+
+from foodgram_backend.settings import *  # noqa: F401,F403
+from foodgram_backend.settings import ALLOWED_HOSTS
+
+# С DEBUG=True Django сохраняет каждый SQL-запрос в connection.queries,
+# и под нагрузкой память процессов растёт.
+DEBUG = False
+
+# Задачи (например, миниатюры изображений) выполняет отдельный
+# процесс run_worker, а не поток запроса.
+TASKS_EAGER = os.getenv('TASKS_EAGER', 'False') == 'True'
+
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', ','.join(ALLOWED_HOSTS)).split(',')
+
+# Процессов gunicorn несколько: версии справочников и множества
+# api.membership должны храниться в общем кеше, иначе сброс в одном
+# процессе не виден остальным.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'memcached:11211'),
+    }
+}
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 300))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
+    },
+    'loggers': {
+        'django.db.backends': {'level': 'WARNING', 'propagate': True},
+    },
+}
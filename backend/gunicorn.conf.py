@@ -0,0 +1,83 @@
+"""Настройки gunicorn для контейнера backend.
+
+Число процессов и потоков подбирается по доступным ядрам (с учётом
+ограничения CPU контейнера); любое значение можно задать переменной
+окружения GUNICORN_*. Для ASGI-профиля:
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker \\
+        foodgram_backend.asgi:application
+"""
+import os
+
+
+def available_cpus():
+    """Ядра, доступные процессу: квота cgroup, иначе маска CPU."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota_files = (
+        ('/sys/fs/cgroup/cpu.max', None),
+        ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us',
+         '/sys/fs/cgroup/cpu/cpu.cfs_period_us'),
+    )
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as file:
+                values = file.read().split()
+            if period_file:
+                with open(period_file) as file:
+                    values.append(file.read().strip())
+        except OSError:
+            continue
+        quota, period = values[0], values[1]
+        if quota not in ('max', '-1'):
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+        break
+    return cpus
+
+
+cores = available_cpus()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+
+# Запросы API в основном ждут базу, поэтому процессов больше, чем
+# ядер, а на малом числе ядер недостающий параллелизм дают потоки.
+workers = int(os.getenv('GUNICORN_WORKERS', min(2 * cores + 1, 12)))
+threads = int(os.getenv('GUNICORN_THREADS', 4 if cores <= 2 else 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS',
+                         'gthread' if threads > 1 else 'sync')
+
+# Перезапуск процесса после max_requests запросов ограничивает рост
+# памяти; разброс не даёт всем процессам перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Django загружается до fork(), и код с данными импорта процессы
+# делят через copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Больше keepalive_timeout nginx для upstream (60 с): соединение
+# закрывает nginx, а не gunicorn посреди запроса.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 65))
+
+# Файлы heartbeat в памяти, а не в overlayfs контейнера.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+raw_env = ['DJANGO_SETTINGS_MODULE=' + os.getenv(
+    'DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings_production')]
+
+
+def post_fork(server, worker):
+    """Соединения с базой, открытые при preload, не переходят в
+    дочерние процессы."""
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    connections.close_all()
@@ -5,13 +5,11 @@ from recipes.models import (FavoriteList, Ingredient, IngredientsRecipe,
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'get_favorites_count']
+    list_display = ['title', 'author', 'favorites_count']
     list_filter = ['author', 'title', 'tags']
+    list_select_related = ['author']
     search_fields = ['title', 'author__username']
 
-    def get_favorites_count(self, obj):
-        return FavoriteList.objects.filter(recipe=obj).count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -38,3 +36,18 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(IngredientsRecipe)
 class IngredientInRecipe(admin.ModelAdmin):
     list_display = ['recipe', 'ingredient', 'amount']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Строку могли перенести в другой рецепт.
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        Recipe.objects.filter(pk__in=recipe_ids).ingredients_changed()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).ingredients_changed()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).ingredients_changed()
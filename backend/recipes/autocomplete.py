@@ -0,0 +1,64 @@
+import threading
+from bisect import bisect_left
+
+from api.cache import ingredients_cache
+from django.apps import apps
+
+
+class PrefixIndex:
+    """Индекс названий в памяти процесса для автодополнения без PostgreSQL.
+
+    Названия хранятся в нижнем регистре (casefold) в отсортированном
+    списке: совпадения по префиксу находятся бинарным поиском,
+    совпадения по подстроке — проходом по списку. Индекс строится
+    при первом запросе и перестраивается, когда меняется версия
+    reference_cache: её увеличивают изменения в любом процессе
+    (админка в другом воркере, load_ingredients). invalidate()
+    сбрасывает индекс текущего процесса сразу.
+    """
+
+    def __init__(self, model_label, field_name, reference_cache):
+        self.model_label = model_label
+        self.field_name = field_name
+        self.reference_cache = reference_cache
+        self._lock = threading.Lock()
+        self._keys = None
+        self._ids = None
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._ids = None
+
+    def _load(self):
+        # Версия читается до выборки: изменение, попавшее между ними,
+        # увеличит версию ещё раз.
+        version = self.reference_cache.get_version()
+        with self._lock:
+            if self._keys is None or self._version != version:
+                model = apps.get_model(self.model_label)
+                rows = sorted(
+                    (value.casefold(), pk) for value, pk in
+                    model.objects.values_list(self.field_name, 'pk')
+                )
+                self._ids = [pk for _, pk in rows]
+                self._keys = [key for key, _ in rows]
+                self._version = version
+            return self._keys, self._ids
+
+    def matches(self, query):
+        """id записей: сначала совпадения по префиксу, затем по подстроке."""
+        keys, ids = self._load()
+        query = query.casefold()
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            yield ids[position]
+            position += 1
+        for key, pk in zip(keys, ids):
+            if query in key and not key.startswith(query):
+                yield pk
+
+
+ingredient_index = PrefixIndex('recipes.Ingredient', 'name',
+                               ingredients_cache)
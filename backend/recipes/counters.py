@@ -0,0 +1,102 @@
+import sqlite3
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+class CounterFieldsMixin:
+    """Модель с полями, которые меняются только UPDATE-запросами.
+
+    save() существующего объекта без update_fields не записывает
+    counter_fields: значения в памяти могли устареть, и полное
+    сохранение затёрло бы параллельные приращения через F().
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            skipped = {*self.counter_fields, *self.get_deferred_fields()}
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+                and field.attname not in skipped
+            ]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+def _supports_update_returning(connection):
+    """UPDATE ... RETURNING есть в PostgreSQL и SQLite с версии 3.35."""
+    if connection.vendor == 'postgresql':
+        return True
+    return (connection.vendor == 'sqlite'
+            and sqlite3.sqlite_version_info >= (3, 35))
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик на delta, не опуская его ниже нуля.
+
+    Возвращает пару (значение до, значение после) или None, если
+    счётчик не изменился. Пара относится именно к этому изменению,
+    поэтому по ней можно ловить переход через порог даже при
+    параллельных изменениях.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if _supports_update_returning(connection):
+        quote = connection.ops.quote_name
+        column = quote(model._meta.get_field(field).column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(model._meta.db_table)} '
+                f'SET {column} = {column} + %s '
+                f'WHERE {quote(model._meta.pk.column)} = %s '
+                f'AND {column} >= %s RETURNING {column}',
+                [delta, pk, max(-delta, 0)])
+            row = cursor.fetchone()
+    else:
+        # Без RETURNING значение читается в той же транзакции: строка
+        # заблокирована UPDATE до коммита.
+        queryset = model.objects.using(using).filter(pk=pk)
+        with transaction.atomic(using=using):
+            updated = queryset.filter(
+                **{f'{field}__gte': max(-delta, 0)}
+            ).update(**{field: F(field) + delta})
+            row = updated and queryset.values_list(field).first()
+    if not row:
+        return None
+    return row[0] - delta, row[0]
+
+
+def count_related(model, field):
+    """Подзапрос: число строк model, ссылающихся на объект через field."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    )
+
+
+def recount(recipe_model, user_model, favorite_model, follow_model,
+            ingredients_model=None):
+    """Пересчитывает все счётчики двумя UPDATE-запросами.
+
+    Модели передаются явно, чтобы функцию можно было вызвать
+    и из миграций с историческими моделями; ingredients_count
+    пересчитывается, только если передана ingredients_model.
+    """
+    counters = {'favorites_count': count_related(favorite_model, 'recipe')}
+    if ingredients_model is not None:
+        counters['ingredients_count'] = count_related(ingredients_model,
+                                                      'recipe')
+    recipes = recipe_model.objects.update(**counters)
+    users = user_model.objects.update(
+        recipes_count=count_related(recipe_model, 'author'),
+        followers_count=count_related(follow_model, 'author'))
+    return recipes, users
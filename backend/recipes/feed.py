@@ -0,0 +1,200 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается по лентам подписчиков (таблица FeedEntry)
+фоновой задачей recipes.feed_fan_out, поэтому чтение ленты — выборка
+по индексу одного пользователя, сколько бы авторов он ни читал. В
+ленте хранится не больше FEED_MAX_ENTRIES последних рецептов.
+
+Рецепты авторов, у которых FEED_FANOUT_MAX_FOLLOWERS подписчиков и
+больше, по лентам не раскладываются: их немного, и при чтении они
+выбираются по индексу recipe_author_pub_date_idx и сливаются с лентой.
+Когда у такого автора подписчиков становится меньше порога, ленты его
+подписчиков пересобираются задачей recipes.feed_rebuild_author: иначе
+рецепты, опубликованные, пока автор был выше порога, пропали бы из них.
+"""
+import heapq
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow, User
+
+# Записей в одном INSERT при раскладке рецепта по лентам.
+FAN_OUT_BATCH_SIZE = 1000
+# Подписчиков в одном INSERT ... SELECT при пересборке лент.
+REBUILD_BATCH_SIZE = 500
+
+
+def is_celebrity(followers_count):
+    return followers_count >= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def trim(user_ids):
+    """Оставляет в лентах user_ids FEED_MAX_ENTRIES последних записей."""
+    ranked = FeedEntry.objects.filter(user_id__in=user_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('user_id'),
+            order_by=(F('pub_date').desc(), F('recipe_id').desc()),
+        )
+    ).values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    FeedEntry.objects.filter(pk__in=RawSQL(
+        f'SELECT id FROM ({sql}) ranked WHERE row_number > %s',
+        (*params, settings.FEED_MAX_ENTRIES)
+    )).delete()
+
+
+def trim_overflow(user_ids):
+    """Удаляет из лент user_ids по одной записи сверх FEED_MAX_ENTRIES.
+
+    После раскладки одного рецепта лента длиннее предела не больше чем
+    на запись, поэтому вместо ранжирования всех записей (trim) у
+    каждого пользователя по индексу берётся только запись с номером
+    FEED_MAX_ENTRIES + 1. Параллельные раскладки могут оставить лишнюю
+    запись; её уберёт следующий trim или rebuild.
+    """
+    overflow = FeedEntry.objects.filter(user_id=OuterRef('pk')).order_by(
+        '-pub_date', '-recipe_id').values('pk')[
+            settings.FEED_MAX_ENTRIES:settings.FEED_MAX_ENTRIES + 1]
+    FeedEntry.objects.filter(pk__in=User.objects.filter(
+        pk__in=user_ids).annotate(overflow=Subquery(overflow)).filter(
+            overflow__isnull=False).values('overflow')).delete()
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора; возвращает их число."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'pk', 'pub_date', 'author_id', 'author__followers_count').first()
+    if recipe is None or is_celebrity(recipe['author__followers_count']):
+        return 0
+    followers = list(Follow.objects.filter(
+        author_id=recipe['author_id']).values_list('user_id', flat=True))
+    for start in range(0, len(followers), FAN_OUT_BATCH_SIZE):
+        batch = followers[start:start + FAN_OUT_BATCH_SIZE]
+        FeedEntry.objects.bulk_create([
+            FeedEntry(user_id=user_id, recipe_id=recipe['pk'],
+                      pub_date=recipe['pub_date'])
+            for user_id in batch
+        ], ignore_conflicts=True)
+        trim_overflow(batch)
+    return len(followers)
+
+
+def backfill(user_id, author_id):
+    """Последние рецепты нового автора в ленте подписчика."""
+    followers_count = User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True).first()
+    if followers_count is None or is_celebrity(followers_count):
+        return 0
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list('pk', 'pub_date')
+    entries = FeedEntry.objects.bulk_create([
+        FeedEntry(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+        for pk, pub_date in recipes[:settings.FEED_MAX_ENTRIES]
+    ], ignore_conflicts=True)
+    trim([user_id])
+    return len(entries)
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты рецепты автора, от которого пользователь
+    отписался."""
+    FeedEntry.objects.filter(user_id=user_id,
+                             recipe__author_id=author_id).delete()
+
+
+def rebuild(user_ids):
+    """Заново собирает ленты user_ids по текущим подпискам.
+
+    Нужна для данных, загруженных в обход сигналов (bulk_create,
+    generate_dataset), после смены FEED_FANOUT_MAX_FOLLOWERS и когда
+    автор опускается ниже порога. Ленты REBUILD_BATCH_SIZE
+    пользователей собираются одним INSERT ... SELECT: рецепты авторов
+    из подписок нумеруются ROW_NUMBER() по каждому подписчику, в ленту
+    попадают первые FEED_MAX_ENTRIES.
+    """
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        ranked = Recipe.objects.filter(
+            author__following__user_id__in=batch,
+            author__followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).annotate(
+            follower_id=F('author__following__user_id'),
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author__following__user_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).order_by().values('follower_id', 'id', 'pub_date', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        with transaction.atomic():
+            FeedEntry.objects.filter(user_id__in=batch).delete()
+            with connections[ranked.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {FeedEntry._meta.db_table} '
+                    '(user_id, recipe_id, pub_date) '
+                    'SELECT follower_id, id, pub_date '
+                    f'FROM ({sql}) ranked WHERE row_number <= %s',
+                    (*params, settings.FEED_MAX_ENTRIES))
+
+
+def rebuild_author(author_id):
+    """Пересобирает ленты подписчиков автора, который опустился ниже
+    FEED_FANOUT_MAX_FOLLOWERS; возвращает их число."""
+    followers_count = User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True).first()
+    if followers_count is None or is_celebrity(followers_count):
+        return 0
+    followers = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    rebuild(followers)
+    return len(followers)
+
+
+def before_filter(before, pub_date, pk):
+    """Условие keyset-навигации: строки строго после before=(дата, id)
+    в порядке убывания (pub_date, id)."""
+    before_date, before_pk = before
+    return (Q(**{f'{pub_date}__lt': before_date})
+            | Q(**{pub_date: before_date, f'{pk}__lt': before_pk})
+            ) & Q(**{f'{pub_date}__lte': before_date})
+
+
+def read(user_id, limit, before=None):
+    """Рецепты ленты пользователя в порядке (-pub_date, -id).
+
+    Не больше limit рецептов, опубликованных раньше before=(pub_date,
+    id), если он задан. Связи рецептов загружены with_related.
+    """
+    entries = FeedEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-recipe_id').values_list('pub_date', 'recipe_id')
+    celebrities = list(Follow.objects.filter(
+        user_id=user_id,
+        author__followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+    pulled = Recipe.objects.filter(author_id__in=celebrities).order_by(
+        '-pub_date', '-id').values_list('pub_date', 'pk')
+    if before is not None:
+        entries = entries.filter(before_filter(before, 'pub_date',
+                                               'recipe_id'))
+        pulled = pulled.filter(before_filter(before, 'pub_date', 'pk'))
+    sources = [entries[:limit]]
+    if celebrities:
+        sources.append(pulled[:limit])
+    # Рецепт автора, ставшего популярным, может оказаться в обоих
+    # источниках.
+    keys, seen = [], set()
+    for key in heapq.merge(*sources, reverse=True):
+        if len(keys) == limit:
+            break
+        if key[1] not in seen:
+            seen.add(key[1])
+            keys.append(key)
+    recipes = Recipe.objects.with_related().in_bulk(
+        [pk for _, pk in keys])
+    return [recipes[pk] for _, pk in keys if pk in recipes]
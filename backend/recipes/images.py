@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+IMAGE_DIR = 'recipes/images'
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+FULL = 'full'
+ORIGINAL = 'original'
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def rendition_name(image_name, rendition):
+    """Путь к варианту изображения; для загруженных до появления
+    вариантов и ещё не обработанных изображений возвращается исходный
+    путь."""
+    directory, filename = os.path.split(image_name)
+    stem, extension = os.path.splitext(filename)
+    if stem != FULL or rendition == FULL:
+        return image_name
+    return f'{directory}/{rendition}{extension}'
+
+
+def verify_image(raw):
+    """Проверяет размер и заголовок файла и возвращает его формат."""
+    if len(raw) > settings.RECIPE_IMAGE_MAX_BYTES:
+        raise InvalidImage('Изображение слишком большое.')
+    try:
+        with Image.open(io.BytesIO(raw)) as probe:
+            probe.verify()
+            return probe.format
+    except (UnidentifiedImageError, OSError, SyntaxError,
+            Image.DecompressionBombError):
+        raise InvalidImage('Загрузите корректное изображение.')
+
+
+def open_image(raw):
+    verify_image(raw)
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except (UnidentifiedImageError, OSError, SyntaxError,
+            Image.DecompressionBombError):
+        raise InvalidImage('Загрузите корректное изображение.')
+    image = ImageOps.exif_transpose(image)
+    image_format = settings.RECIPE_IMAGE_FORMAT
+    has_alpha = image.mode in ('RGBA', 'LA', 'P')
+    if image_format == 'WEBP' and has_alpha:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def encode(image, size):
+    rendition = image.copy()
+    rendition.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    rendition.save(buffer, settings.RECIPE_IMAGE_FORMAT,
+                   quality=settings.RECIPE_IMAGE_QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def image_directory(raw):
+    digest = hashlib.sha256(raw).hexdigest()
+    return f'{IMAGE_DIR}/{digest[:2]}/{digest}'
+
+
+def full_name(directory):
+    return f'{directory}/{FULL}.{EXTENSIONS[settings.RECIPE_IMAGE_FORMAT]}'
+
+
+def is_original(image_name):
+    """Изображение загружено, но варианты для него ещё не готовы."""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return stem == ORIGINAL
+
+
+def save_original(raw):
+    """Проверяет загрузку и сохраняет её без обработки.
+
+    Каталог назван по sha256 исходных байтов: если это изображение
+    уже обработано, сразу возвращается путь к варианту full. Иначе
+    возвращается путь к исходному файлу, а варианты строит задача
+    recipes.image_renditions.
+
+    Возвращает путь и признак, что файл записан этим вызовом: такой
+    файл нужно удалить, если рецепт не сохранится.
+    """
+    directory = image_directory(raw)
+    name = full_name(directory)
+    if default_storage.exists(name):
+        return name, False
+    extension = verify_image(raw).lower()
+    name = f'{directory}/{ORIGINAL}.{extension}'
+    if default_storage.exists(name):
+        return name, False
+    default_storage.save(name, ContentFile(raw))
+    return name, True
+
+
+def store_renditions(original_name):
+    """Строит все варианты исходного изображения.
+
+    Возвращает путь к варианту full.
+    """
+    name = full_name(os.path.dirname(original_name))
+    if not default_storage.exists(name):
+        with default_storage.open(original_name) as original:
+            image = open_image(original.read())
+        # Вариант full пишется последним: его наличие означает,
+        # что готовы все остальные.
+        renditions = sorted(settings.RECIPE_IMAGE_RENDITIONS.items(),
+                            key=lambda item: item[0] == FULL)
+        for rendition, size in renditions:
+            path = rendition_name(name, rendition)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(path, encode(image, size))
+    return name
@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from recipes import feed
+from recipes.images import store_renditions
+from recipes.models import Recipe, ShoppingList
+from recipes.utils import save_shopping_list_report
+from tasks.queue import task
+
+
+@task('recipes.image_renditions')
+def image_renditions(name):
+    """Варианты загруженного изображения рецепта.
+
+    Рецепты переключаются на вариант full, исходный файл удаляется.
+    """
+    full_name = store_renditions(name)
+    updated = Recipe.objects.filter(image=name).update(
+        image=full_name, updated_at=timezone.now())
+    default_storage.delete(name)
+    return {'image': full_name, 'recipes': updated}
+
+
+@task('recipes.shopping_list_export', max_attempts=2)
+def shopping_list_export(user_id, file_type):
+    """Файл со списком покупок пользователя в хранилище медиафайлов."""
+    name = save_shopping_list_report(
+        ShoppingList.objects.filter(user_id=user_id), file_type,
+        f'shopping_lists/{user_id}')
+    return {'url': default_storage.url(name), 'type': file_type}
+
+
+@task('recipes.feed_fan_out')
+def feed_fan_out(recipe_id):
+    """Новый рецепт в лентах подписчиков автора."""
+    return {'followers': feed.fan_out(recipe_id)}
+
+
+@task('recipes.feed_backfill')
+def feed_backfill(user_id, author_id):
+    """Последние рецепты автора в ленте нового подписчика."""
+    return {'entries': feed.backfill(user_id, author_id)}
+
+
+@task('recipes.feed_rebuild_author')
+def feed_rebuild_author(author_id):
+    """Ленты подписчиков автора, переставшего быть популярным."""
+    return {'followers': feed.rebuild_author(author_id)}
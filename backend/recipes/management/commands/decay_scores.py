@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = ('Применяет затухание к счетам популярности рецептов; '
+            'запускается по расписанию, например раз в час.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Заново посчитать счета по избранному и '
+                                 'спискам покупок.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            scored = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Счета пересчитаны для рецептов: {scored}'))
+            return
+        decayed, removed = trending.decay()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено счетов: {decayed}, удалено: {removed}'))
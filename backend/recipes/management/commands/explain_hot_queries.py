@@ -0,0 +1,178 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Exists, OuterRef
+from recipes.models import (FavoriteList, FeedEntry, IngredientsRecipe, Recipe,
+                            ShoppingList, Tag)
+from recipes.utils import get_shopping_list
+from users.models import Follow, User
+
+# Строки плана с полным чтением таблицы.
+FULL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\S+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bINDEX\b)'),
+}
+# Подзапросы SQLite, которые читаются так же, как таблицы.
+CO_ROUTINE = re.compile(r'CO-ROUTINE (\w+)')
+
+
+def full_scan_tables(vendor, plan):
+    """Таблицы, которые план читает целиком; None — СУБД не
+    поддерживается."""
+    full_scan = FULL_SCAN.get(vendor)
+    if full_scan is None:
+        return None
+    return sorted(set(full_scan.findall(plan))
+                  - set(CO_ROUTINE.findall(plan)))
+
+
+class Command(BaseCommand):
+    help = ('Выводит планы выполнения частых запросов API и отмечает '
+            'полное чтение таблиц. Запускать на данных, близких по '
+            'объёму к рабочим (manage.py generate_dataset).')
+
+    queries = (
+        'recipes_list', 'recipes_by_author', 'recipes_by_tags',
+        'recipes_favorited', 'recipes_in_cart', 'membership_favorites',
+        'membership_cart', 'membership_following', 'author_followers',
+        'subscriptions', 'subscription_recipes', 'recipe_ingredients',
+        'cookable', 'shopping_list', 'recipe_favorites', 'search',
+        'feed', 'trending',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', action='append', dest='only',
+                            choices=self.queries,
+                            help='Только этот запрос; можно указать '
+                                 'несколько раз.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='EXPLAIN ANALYZE с буферами: запрос '
+                                 'выполняется (только PostgreSQL).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        vendor = connections[self.using].vendor
+        explain_options = {}
+        if options['analyze']:
+            if vendor != 'postgresql':
+                raise CommandError('--analyze поддерживается только '
+                                   'на PostgreSQL.')
+            explain_options = {'analyze': True, 'buffers': True}
+        self.sample()
+        flagged = []
+        for name in options['only'] or self.queries:
+            plan = getattr(self, name)().explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan + '\n')
+            tables = full_scan_tables(vendor, plan)
+            if tables:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(
+                    'Полное чтение: ' + ', '.join(tables) + '\n'))
+        if flagged:
+            self.stdout.write(self.style.WARNING(
+                'С полным чтением таблиц: ' + ', '.join(flagged)))
+        elif vendor in FULL_SCAN:
+            self.stdout.write(self.style.SUCCESS(
+                'Все запросы используют индексы.'))
+
+    def objects(self, model):
+        return model.objects.using(self.using)
+
+    def sample(self):
+        """Самые нагруженные объекты: так планы ближе к худшему случаю."""
+        self.user_id = self.objects(Follow).values('user_id').annotate(
+            follows=Count('pk')).order_by('-follows').values_list(
+                'user_id', flat=True).first()
+        self.author_id = self.objects(User).order_by(
+            '-recipes_count').values_list('pk', flat=True).first()
+        self.recipe_id = self.objects(Recipe).order_by(
+            '-favorites_count').values_list('pk', flat=True).first()
+        if None in (self.user_id, self.author_id, self.recipe_id):
+            raise CommandError('Нет пользователей или рецептов: запустите '
+                               'manage.py generate_dataset.')
+        self.tag_ids = list(self.objects(Tag).values_list(
+            'pk', flat=True)[:2])
+        self.ingredient_ids = list(self.objects(IngredientsRecipe).filter(
+            recipe_id=self.recipe_id).values_list('ingredient_id', flat=True))
+        self.word = (self.objects(Recipe).filter(
+            pk=self.recipe_id).values_list('title', flat=True).first()
+            .split()[0])
+
+    def recipes(self):
+        return self.objects(Recipe).order_by('-pub_date', '-id')
+
+    def recipes_list(self):
+        return self.recipes()[:6]
+
+    def recipes_by_author(self):
+        return self.recipes().filter(author_id=self.author_id)[:6]
+
+    def recipes_by_tags(self):
+        return self.recipes().with_any_tag(self.tag_ids)[:6]
+
+    def in_user_list(self, model):
+        return self.recipes().filter(Exists(
+            self.objects(model).filter(user_id=self.user_id,
+                                       recipe_id=OuterRef('pk'))))[:6]
+
+    def recipes_favorited(self):
+        return self.in_user_list(FavoriteList)
+
+    def recipes_in_cart(self):
+        return self.in_user_list(ShoppingList)
+
+    def membership_favorites(self):
+        return self.objects(FavoriteList).filter(
+            user_id=self.user_id).values_list('recipe_id', flat=True)
+
+    def membership_cart(self):
+        return self.objects(ShoppingList).filter(
+            user_id=self.user_id).values_list('recipe_id', flat=True)
+
+    def membership_following(self):
+        return self.objects(Follow).filter(
+            user_id=self.user_id).values_list('author_id', flat=True)
+
+    def author_followers(self):
+        return self.objects(Follow).filter(
+            author_id=self.author_id).values_list('user_id', flat=True)
+
+    def subscriptions(self):
+        return self.objects(User).filter(
+            following__user_id=self.user_id).order_by('pk')[:6]
+
+    def subscription_recipes(self):
+        authors = self.objects(Follow).filter(
+            user_id=self.user_id).values_list('author_id', flat=True)
+        return self.objects(Recipe).latest_per_author(list(authors), 3)
+
+    def recipe_ingredients(self):
+        return self.objects(IngredientsRecipe).filter(
+            recipe_id=self.recipe_id).select_related('ingredient')
+
+    def cookable(self):
+        return self.objects(Recipe).cookable(self.ingredient_ids)[:6]
+
+    def shopping_list(self):
+        return get_shopping_list(self.objects(ShoppingList).filter(
+            user_id=self.user_id)).using(self.using)
+
+    def recipe_favorites(self):
+        return self.objects(FavoriteList).filter(
+            recipe_id=self.recipe_id).values('recipe_id').annotate(
+                total=Count('pk'))
+
+    def search(self):
+        return self.objects(Recipe).search(self.word)[:6]
+
+    def feed(self):
+        return self.objects(FeedEntry).filter(user_id=self.user_id).order_by(
+            '-pub_date', '-recipe_id').values_list('pub_date', 'recipe_id')[:7]
+
+    def trending(self):
+        return self.objects(Recipe).filter(
+            trending_score__score__gt=0
+        ).order_by('-trending_score__score', '-trending_score__recipe_id')[:10]
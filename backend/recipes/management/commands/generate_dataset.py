@@ -0,0 +1,274 @@
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from recipes import feed, trending
+from recipes.counters import recount
+from recipes.models import (FavoriteList, Ingredient, IngredientsRecipe,
+                            Recipe, ShoppingList, Tag)
+from recipes.search import refresh_search_index
+from users.models import Follow, User
+
+# Пересчёт идентификаторов и сохранение пачки — одним запросом на
+# столько строк.
+DEFAULT_BATCH_SIZE = 5000
+# Строка о ходе работы — раз в столько пачек.
+PROGRESS_EVERY = 20
+# Сколько выборок подряд без новых пар прерывают создание пар.
+STALLED_ROUNDS = 3
+
+
+def power_law_weights(size, alpha):
+    """Накопленные веса распределения Ципфа: у элемента с номером i
+    вес 1 / (i + 1) ** alpha."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** alpha for rank in range(size)))
+
+
+@contextmanager
+def own_timestamps(model, *field_names):
+    """Отключает auto_now/auto_now_add, чтобы bulk_create сохранил
+    даты, заданные генератором."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для нагрузочных тестов: '
+            'пользователей, рецепты, избранное, корзины и подписки со '
+            'степенным распределением популярности.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=10000,
+                            help='Строк в списках покупок.')
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--tags-per-recipe', type=int, nargs=2,
+                            default=(1, 3), metavar=('MIN', 'MAX'))
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности '
+                 'авторов и рецептов.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить рецепты.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--ingredients-path',
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.csv'),
+            help='Каталог ингредиентов, если таблица ингредиентов пуста.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.alpha = options['alpha']
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        started = time.perf_counter()
+
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', path=options['ingredients_path'],
+                         stdout=self.stdout)
+        ingredients = list(Ingredient.objects.values_list('pk', 'name'))
+        tag_ids = self.create_tags(options['tags'])
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids, ingredients,
+            options['ingredients_per_recipe'], options['tags_per_recipe'],
+            options['days'])
+        self.create_pairs(FavoriteList, 'user_id', 'recipe_id',
+                          options['favorites'], user_ids, recipe_ids)
+        self.create_pairs(ShoppingList, 'user_id', 'recipe_id',
+                          options['carts'], user_ids, recipe_ids)
+        self.create_pairs(Follow, 'user_id', 'author_id',
+                          options['follows'], user_ids, user_ids,
+                          distinct=True)
+
+        self.stage('Счётчики', lambda: recount(
+            Recipe, User, FavoriteList, Follow, IngredientsRecipe))
+        self.stage('Поисковый индекс', refresh_search_index)
+        self.stage('Популярность', trending.rebuild)
+        self.stage('Ленты подписок', lambda: feed.rebuild(list(
+            Follow.objects.values_list('user_id', flat=True).distinct())))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с: '
+            f'пользователей {User.objects.count()}, '
+            f'рецептов {Recipe.objects.count()}, '
+            f'избранного {FavoriteList.objects.count()}, '
+            f'в корзинах {ShoppingList.objects.count()}, '
+            f'подписок {Follow.objects.count()}'))
+
+    def stage(self, title, func):
+        started = time.perf_counter()
+        func()
+        self.stdout.write(f'{title}: {time.perf_counter() - started:.1f} с')
+
+    def progress(self, title, done, total, started):
+        if done < total and done // self.batch_size % PROGRESS_EVERY:
+            return
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{title}: {done}/{total} '
+                          f'({done / elapsed if elapsed else done:.0f}/с)')
+
+    def new_ids(self, model, last_id):
+        """Идентификаторы строк, созданных после last_id.
+
+        bulk_create на SQLite не возвращает первичные ключи; генератор
+        считается единственным, кто пишет в базу.
+        """
+        return list(model.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def last_id(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+    def create_tags(self, count):
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {number}', slug=f'tag-{number}',
+                color=f'#{number * 0x10101 % 0x1000000:06X}')
+            for number in range(count)
+        ], ignore_conflicts=True)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self, count):
+        started = time.perf_counter()
+        first = self.last_id(User) + 1
+        password = make_password(None)
+        user_ids = []
+        for offset in range(0, count, self.batch_size):
+            last_id = self.last_id(User)
+            User.objects.bulk_create([
+                User(username=f'user{number}',
+                     email=f'user{number}@example.com',
+                     first_name='Имя', last_name=f'Фамилия{number}',
+                     password=password)
+                for number in range(
+                    first + offset,
+                    first + min(offset + self.batch_size, count))
+            ], ignore_conflicts=True)
+            user_ids += self.new_ids(User, last_id)
+            self.progress('Пользователи', len(user_ids), count, started)
+        return user_ids
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredients,
+                       ingredients_per_recipe, tags_per_recipe, days):
+        started = time.perf_counter()
+        authors = power_law_weights(len(user_ids), self.alpha)
+        words = [name for _, name in ingredients]
+        now = timezone.now()
+        step = timedelta(days=days) / max(count, 1)
+        first = self.last_id(Recipe) + 1
+        recipe_ids = []
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            last_id = self.last_id(Recipe)
+            recipes = []
+            for index, author_id in enumerate(self.random.choices(
+                    user_ids, cum_weights=authors, k=size)):
+                number = first + offset + index
+                published = now - step * (count - offset - index)
+                recipes.append(Recipe(
+                    author_id=author_id,
+                    title=f'Рецепт {number}',
+                    description=(f'Рецепт {number}: ' + ', '.join(
+                        self.random.sample(words, 5))),
+                    time=self.random.randint(5, 180),
+                    pub_date=published, updated_at=published))
+            with transaction.atomic(), own_timestamps(
+                    Recipe, 'pub_date', 'updated_at'):
+                Recipe.objects.bulk_create(recipes)
+                ids = self.new_ids(Recipe, last_id)
+                self.attach(ids, tag_ids, ingredients,
+                            ingredients_per_recipe, tags_per_recipe)
+            recipe_ids += ids
+            self.progress('Рецепты', len(recipe_ids), count, started)
+        return recipe_ids
+
+    def attach(self, recipe_ids, tag_ids, ingredients,
+               ingredients_per_recipe, tags_per_recipe):
+        """Теги и ингредиенты для пачки рецептов."""
+        tags, amounts = [], []
+        through = Recipe.tags.through
+        for recipe_id in recipe_ids:
+            for tag_id in self.random.sample(tag_ids, min(
+                    len(tag_ids), self.random.randint(*tags_per_recipe))):
+                tags.append(through(recipe_id=recipe_id, tag_id=tag_id))
+            for ingredient_id, _ in self.random.sample(ingredients, min(
+                    len(ingredients),
+                    self.random.randint(*ingredients_per_recipe))):
+                amounts.append(IngredientsRecipe(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 1000)))
+        through.objects.bulk_create(tags, batch_size=self.batch_size,
+                                    ignore_conflicts=True)
+        IngredientsRecipe.objects.bulk_create(
+            amounts, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def create_pairs(self, model, source_field, target_field, count,
+                     source_ids, target_ids, distinct=False):
+        """count новых пар: источник выбирается равномерно, цель — по
+        степенному закону (популярные авторы и рецепты); distinct
+        исключает пары из одного объекта.
+
+        Повторы внутри пачки отбрасываются сразу, а совпадения с уже
+        сохранёнными парами отклоняет уникальное ограничение
+        (ignore_conflicts). Поэтому созданные пары считаются по числу
+        строк в таблице, и выборка продолжается, пока не наберётся
+        count. Если STALLED_ROUNDS выборок подряд не дали ни одной
+        новой пары (свободных пар почти не осталось), создаётся сколько
+        получилось.
+        """
+        if not count or not source_ids or not target_ids:
+            return
+        started = time.perf_counter()
+        weights = power_law_weights(len(target_ids), self.alpha)
+        title = model._meta.verbose_name_plural
+        initial = model.objects.count()
+        created = stalled = 0
+        while created < count and stalled < STALLED_ROUNDS:
+            size = min(self.batch_size, count - created)
+            pairs = set()
+            for pair in zip(
+                self.random.choices(source_ids, k=self.batch_size),
+                self.random.choices(target_ids, cum_weights=weights,
+                                    k=self.batch_size)
+            ):
+                if distinct and pair[0] == pair[1]:
+                    continue
+                pairs.add(pair)
+                if len(pairs) == size:
+                    break
+            model.objects.bulk_create(
+                [model(**{source_field: source, target_field: target})
+                 for source, target in pairs],
+                ignore_conflicts=True)
+            total = model.objects.count() - initial
+            stalled = 0 if total > created else stalled + 1
+            created = total
+            self.progress(title, created, count, started)
+        if created < count:
+            self.stdout.write(self.style.WARNING(
+                f'{title}: создано {created} из {count}, свободных пар '
+                f'почти не осталось.'))
@@ -0,0 +1,151 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import Ingredient
+from recipes.signals import ingredients_bulk_loaded
+
+READ_SIZE = 64 * 1024
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def iter_json(file):
+    """Объекты JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            if not buffer:
+                continue
+            if buffer[0] != '[':
+                raise CommandError('Ожидается JSON-массив ингредиентов')
+            buffer = buffer[1:]
+            started = True
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if not buffer or buffer[0] == ']':
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            buffer = buffer[end:]
+            yield item['name'], item.get('measurement_unit', item.get('unit'))
+    if buffer.strip() not in ('', ']'):
+        raise CommandError('Файл JSON обрезан или повреждён')
+
+
+READERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    return iter(lambda: list(islice(iterator, size)), [])
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог ингредиентов из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.csv'),
+            help='Файл с ингредиентами (по умолчанию data/ingredients.csv).')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним запросом.')
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Обновлять единицу измерения у ингредиента с тем же '
+                 'названием вместо добавления новой записи.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только разобрать файл и посчитать изменения.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}')
+        started = time.perf_counter()
+        existing = set(Ingredient.objects.values_list('name', 'unit'))
+        units_by_name = {}
+        for name, unit in existing:
+            units_by_name.setdefault(name, set()).add(unit)
+        seen_names = set()
+        total = created = updated = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = READERS[file_format](file)
+            for batch in chunked(rows, options['batch_size']):
+                total += len(batch)
+                new, changed = self.split_batch(
+                    batch, existing, units_by_name, seen_names,
+                    options['upsert'])
+                created += len(new)
+                updated += len(changed)
+                if options['dry_run']:
+                    continue
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, unit=unit) for name, unit in new],
+                    ignore_conflicts=True)
+                if changed:
+                    self.update_units(changed)
+        elapsed = time.perf_counter() - started
+        if not options['dry_run'] and (created or updated):
+            ingredients_bulk_loaded.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if options["dry_run"] else "Загружено"}: '
+            f'{total} строк за {elapsed:.3f} с '
+            f'({total / elapsed if elapsed else total:.0f} строк/с); '
+            f'новых: {created}, обновлено: {updated}'))
+
+    def split_batch(self, batch, existing, units_by_name, seen_names,
+                    upsert):
+        """Делит строки на новые и (в режиме upsert) обновляемые.
+
+        Обновляется только ингредиент, у которого в базе одна единица
+        измерения и который встречается в файле впервые: названия
+        с несколькими единицами (например, «пекарский порошок»)
+        остаются отдельными записями.
+        """
+        new, changed = [], {}
+        for name, unit in batch:
+            name, unit = name.strip(), unit.strip()
+            first_time = name not in seen_names
+            seen_names.add(name)
+            if (name, unit) in existing:
+                continue
+            units = units_by_name.get(name)
+            if upsert and first_time and units and len(units) == 1:
+                old_unit = units.pop()
+                existing.discard((name, old_unit))
+                changed[name] = (old_unit, unit)
+            else:
+                new.append((name, unit))
+            existing.add((name, unit))
+            units_by_name.setdefault(name, set()).add(unit)
+        return new, changed
+
+    def update_units(self, changed):
+        ingredients = list(Ingredient.objects.filter(name__in=changed))
+        for ingredient in ingredients:
+            _, ingredient.unit = changed[ingredient.name]
+        Ingredient.objects.bulk_update(ingredients, ('unit',))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipes import feed
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = ('Заново собирает ленты подписок: после загрузки данных в '
+            'обход сигналов или смены FEED_FANOUT_MAX_FOLLOWERS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users',
+                            help='Только ленту этого пользователя; можно '
+                                 'указать несколько раз.')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(
+            Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True).distinct())
+        feed.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {len(user_ids)}'))
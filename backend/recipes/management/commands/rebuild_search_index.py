@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.search import refresh_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс рецептов.'
+
+    def handle(self, *args, **options):
+        refresh_search_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
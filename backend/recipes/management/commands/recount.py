@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes.counters import recount
+from recipes.models import FavoriteList, IngredientsRecipe, Recipe
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, ингредиентов рецепта, '
+            'рецептов автора и подписчиков.')
+
+    def handle(self, *args, **options):
+        recipes, users = recount(Recipe, User, FavoriteList, Follow,
+                                 IngredientsRecipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}'))
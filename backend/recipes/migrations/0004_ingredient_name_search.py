@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Выражение UPPER("name"::text) совпадает с тем, что Django генерирует
+# для istartswith/icontains на PostgreSQL, поэтому планировщик
+# использует эти индексы для автодополнения ингредиентов.
+CREATE_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER("name"::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (UPPER("name"::text) text_pattern_ops)',
+)
+
+DROP_SQL = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix',
+)
+
+
+def run_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_alter_ingredientsrecipe_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_postgresql(CREATE_SQL),
+                             run_postgresql(DROP_SQL)),
+    ]
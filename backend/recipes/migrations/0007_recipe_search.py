@@ -0,0 +1,64 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:08
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Копия recipes.search на момент миграции: модуль может измениться.
+FTS_TABLE = 'recipes_recipe_fts'
+PG_UPDATE_SQL = (
+    'UPDATE recipes_recipe r SET search_vector = '
+    "setweight(to_tsvector('russian', r.title), 'A') || "
+    "setweight(to_tsvector('russian', r.description), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(("
+    "SELECT string_agg(i.name, ' ') FROM recipes_ingredientsrecipe ir "
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    "WHERE ir.recipe_id = r.id), '')), 'C')"
+)
+SQLITE_CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "title, description, ingredients, tokenize = 'unicode61')"
+)
+SQLITE_INSERT_SQL = (
+    f'INSERT INTO {FTS_TABLE} (rowid, title, description, ingredients) '
+    'SELECT r.id, r.title, r.description, coalesce(('
+    "SELECT group_concat(i.name, ' ') FROM recipes_ingredientsrecipe ir "
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    "WHERE ir.recipe_id = r.id), '') FROM recipes_recipe r"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+            'ON recipes_recipe USING gin (search_vector)')
+        schema_editor.execute(PG_UPDATE_SQL)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE_SQL)
+        schema_editor.execute(SQLITE_INSERT_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_ingredients(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientsRecipe = apps.get_model('recipes', 'IngredientsRecipe')
+    Recipe.objects.update(ingredients_count=Coalesce(
+        Subquery(
+            IngredientsRecipe.objects.filter(recipe=OuterRef('pk'))
+            .order_by().values('recipe')
+            .annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Ингредиентов'),
+        ),
+        migrations.RunPython(count_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+# Промежуточная таблица тегов создаётся Django автоматически, поэтому
+# индекс добавляется SQL-запросом. Уникальный индекс (recipe_id, tag_id)
+# обслуживает EXISTS от рецепта к тегам, этот — выборку по тегу.
+CREATE_SQL = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+    'ON recipes_recipe_tags (tag_id, recipe_id)'
+)
+DROP_SQL = 'DROP INDEX IF EXISTS recipes_recipe_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_ingredients_count'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
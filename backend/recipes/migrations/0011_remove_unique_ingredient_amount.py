@@ -0,0 +1,52 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+
+# Верхняя граница PositiveSmallIntegerField.
+MAX_AMOUNT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Повторы ингредиента в рецепте сливаются в одну строку с суммой
+    количеств перед ограничением (recipe, ingredient)."""
+    IngredientsRecipe = apps.get_model('recipes', 'IngredientsRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    duplicates = IngredientsRecipe.objects.values(
+        'recipe', 'ingredient',
+    ).annotate(
+        rows=Count('pk'), keep=Min('pk'), total=Sum('amount'),
+    ).filter(rows__gt=1)
+    recipe_ids = set()
+    for duplicate in list(duplicates):
+        recipe_ids.add(duplicate['recipe'])
+        IngredientsRecipe.objects.filter(pk=duplicate['keep']).update(
+            amount=min(duplicate['total'], MAX_AMOUNT))
+        IngredientsRecipe.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient'],
+        ).exclude(pk=duplicate['keep']).delete()
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        ingredients_count=Subquery(
+            IngredientsRecipe.objects.filter(
+                recipe=OuterRef('pk'),
+            ).order_by().values('recipe').annotate(
+                total=Count('pk'),
+            ).values('total')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_updated_at'),
+    ]
+
+    operations = [
+        # Ограничение на (ingredient, amount) запрещало двум рецептам
+        # одно и то же количество ингредиента.
+        migrations.RemoveConstraint(
+            model_name='ingredientsrecipe',
+            name='unique_ingredient_amount',
+        ),
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
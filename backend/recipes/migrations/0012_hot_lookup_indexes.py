@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from foodgram_backend.migration_operations import (
+    AddIndexConcurrently, AddUniqueConstraintConcurrently)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0011_remove_unique_ingredient_amount'),
+    ]
+
+    operations = [
+        AddUniqueConstraintConcurrently(
+            model_name='ingredientsrecipe',
+            constraint=models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'),
+        ),
+        AddIndexConcurrently(
+            model_name='ingredientsrecipe',
+            index=models.Index(fields=['ingredient', 'recipe'],
+                               name='ingredient_recipe_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'],
+                               name='recipe_author_pub_date_idx'),
+        ),
+    ]
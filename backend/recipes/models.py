@@ -1,15 +1,72 @@
+from itertools import islice
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, Exists, ExpressionWrapper, F,
+                              FloatField, OuterRef, Prefetch, Q, Value, When,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import NullIf, RowNumber
+from django.utils import timezone
+from recipes.autocomplete import ingredient_index
+from recipes.counters import CounterFieldsMixin, count_related
+from recipes.search import SEARCH_CONFIG, refresh_search_index, sqlite_search
 
 User = get_user_model()
 
+# Кандидатов ingredient_index в одной проверке остальными фильтрами.
+AUTOCOMPLETE_CHUNK_SIZE = 500
+
+
+class IngredientQuerySet(models.QuerySet):
+
+    def autocomplete(self, query, limit):
+        """Ингредиенты, содержащие query: сначала совпадения по началу
+        названия, затем по подстроке; не больше limit записей.
+
+        На PostgreSQL запрос обслуживают индексы из миграции
+        0004_ingredient_name_search, на остальных базах — индекс
+        в памяти процесса recipes.autocomplete.ingredient_index.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            return self.filter(name__icontains=query).annotate(
+                rank=Case(When(name__istartswith=query, then=Value(0)),
+                          default=Value(1))
+            ).order_by('rank', 'name')[:limit]
+        matches = ingredient_index.matches(query)
+        if not self.query.has_filters():
+            ids = list(islice(matches, limit))
+        else:
+            # Индекс не знает об остальных фильтрах (start_name,
+            # contain_name): кандидаты проверяются пачками, пока не
+            # наберётся limit подходящих.
+            ids = []
+            while len(ids) < limit:
+                chunk = list(islice(matches, AUTOCOMPLETE_CHUNK_SIZE))
+                if not chunk:
+                    break
+                found = set(self.filter(pk__in=chunk).values_list(
+                    'pk', flat=True))
+                ids.extend(pk for pk in chunk if pk in found)
+            ids = ids[:limit]
+        if not ids:
+            return self.none()
+        return self.filter(pk__in=ids).order_by(
+            Case(*(When(pk=pk, then=Value(position))
+                   for position, pk in enumerate(ids)))
+        )
+
 
 class Ingredient(models.Model):
     """Модель ингредиента."""
     name = models.CharField(max_length=64)
     unit = models.CharField(max_length=64)
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'
@@ -49,7 +106,126 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов с заранее загруженными связями."""
+
+    def with_related(self):
+        """Автор, теги и ингредиенты фиксированным числом запросов.
+
+        Флаги is_favorited, is_in_shopping_cart и is_subscribed
+        сериализаторы берут из api.membership, а не из запроса;
+        поисковый вектор не загружается.
+        """
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(*self.related_lookups())
+
+    @staticmethod
+    def related_lookups():
+        """Связи, которые with_related загружает через prefetch_related."""
+        return (
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=IngredientsRecipe.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_any_tag(self, tags):
+        """Рецепты хотя бы с одним из тегов tags (объекты, id или выборка).
+
+        Условие EXISTS по промежуточной таблице не размножает строки
+        рецептов, поэтому DISTINCT не нужен.
+        """
+        return self.filter(Exists(
+            Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'),
+                                               tag__in=tags)
+        ))
+
+    def ingredients_changed(self):
+        """Обновляет рецепты выборки после изменения их ингредиентов.
+
+        У IngredientsRecipe нет сигналов: код, который меняет строки,
+        вызывает этот метод один раз на все рецепты. ingredients_count
+        и updated_at пересчитываются одним UPDATE, поисковый индекс —
+        после коммита.
+        """
+        recipe_ids = list(self.values_list('pk', flat=True))
+        self.model.objects.using(self.db).filter(pk__in=recipe_ids).update(
+            ingredients_count=count_related(IngredientsRecipe, 'recipe'),
+            updated_at=timezone.now())
+        using = self.db
+        transaction.on_commit(
+            lambda: refresh_search_index(recipe_ids, using), using=using)
+        return len(recipe_ids)
+
+    def search(self, query):
+        """Рецепты по словам из названия, описания и ингредиентов.
+
+        Каждому рецепту добавляется ранг rank; сначала идут лучшие
+        совпадения. На PostgreSQL поиск идёт по столбцу search_vector
+        с GIN-индексом, на SQLite — по таблице FTS5 (recipes.search).
+        """
+        vendor = connections[self.db].vendor
+        if vendor == 'postgresql':
+            search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                       search_type='websearch')
+            queryset = self.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F('search_vector'), search_query))
+        elif vendor == 'sqlite':
+            queryset = sqlite_search(self, query)
+        else:
+            queryset = self.filter(
+                Q(title__icontains=query)
+                | Q(description__icontains=query)
+                | Q(ingredients__name__icontains=query)
+            ).distinct().annotate(rank=Value(0))
+        return queryset.order_by('-rank', '-pub_date', '-id')
+
+    def cookable(self, ingredient_ids, min_coverage=0):
+        """Рецепты, которые можно приготовить из ингредиентов набора.
+
+        matched — сколько ингредиентов рецепта есть в наборе, coverage —
+        их доля от ingredients_count; рецепты с coverage ниже
+        min_coverage отбрасываются, лучшие покрытия идут первыми.
+        Выборка начинается с индекса IngredientsRecipe по ingredient_id
+        и затрагивает только рецепты хотя бы с одним ингредиентом набора.
+        """
+        matched = Count('recipe_ingredients')
+        return self.filter(
+            recipe_ingredients__ingredient_id__in=ingredient_ids
+        ).annotate(
+            matched=matched,
+            coverage=ExpressionWrapper(
+                matched * 1.0 / NullIf(F('ingredients_count'), 0),
+                output_field=FloatField()),
+        ).filter(
+            coverage__gte=min_coverage
+        ).order_by('-coverage', '-matched', '-pub_date', '-id')
+
+    def latest_per_author(self, author_ids, limit=None):
+        """Рецепты авторов author_ids, не больше limit последних у каждого.
+
+        Ограничение выполняется в базе одним запросом с
+        ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC).
+        """
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        ranked = queryset.order_by().annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE row_number <= %s',
+            (*params, limit)
+        ))
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель Рецепта."""
     author = models.ForeignKey(User,
                                verbose_name='Автор',
@@ -70,11 +246,32 @@ class Recipe(models.Model):
                                        validators=[MinValueValidator(1)])
     pub_date = models.DateTimeField(verbose_name="Дата публикации рецепта",
                                     auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения',
+                                      auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False)
+    ingredients_count = models.PositiveIntegerField(
+        verbose_name='Ингредиентов', default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    # search_vector пересчитывается SQL-запросом refresh_search_index.
+    counter_fields = ('favorites_count', 'ingredients_count',
+                      'search_vector')
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            # Рецепты автора (?author=, подписки, лента) уже в порядке
+            # выдачи.
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=('title', 'description'),
@@ -92,7 +289,8 @@ class IngredientsRecipe(models.Model):
                                    on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe,
                                verbose_name='Рецепт',
-                               on_delete=models.CASCADE)
+                               on_delete=models.CASCADE,
+                               related_name='recipe_ingredients')
     amount = models.PositiveSmallIntegerField(verbose_name='Количество',
                                               validators=[MinValueValidator(1)]
                                               )
@@ -102,10 +300,16 @@ class IngredientsRecipe(models.Model):
         verbose_name_plural = 'Количества ингредиентов'
         constraints = (
             models.UniqueConstraint(
-                fields=('ingredient', 'amount',),
-                name='unique_ingredient_amount',
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
             ),
         )
+        indexes = (
+            # Подбор рецептов по ингредиентам: recipe_id берётся из
+            # индекса без чтения таблицы.
+            models.Index(fields=('ingredient', 'recipe'),
+                         name='ingredient_recipe_idx'),
+        )
 
     def __str__(self):
         return (
@@ -123,6 +327,8 @@ class ShoppingList(models.Model):
                                verbose_name='Рецепт',
                                on_delete=models.CASCADE,
                                related_name='shopping_list')
+    added_at = models.DateTimeField(verbose_name='Дата добавления',
+                                    auto_now_add=True)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -149,6 +355,8 @@ class FavoriteList(models.Model):
                                verbose_name='Рецепт',
                                on_delete=models.CASCADE,
                                related_name='favorite_list')
+    added_at = models.DateTimeField(verbose_name='Дата добавления',
+                                    auto_now_add=True)
 
     class Meta:
         verbose_name = 'Список избранного'
@@ -163,3 +371,61 @@ class FavoriteList(models.Model):
     def __str__(self):
         return (f'{self.user.username} добавил'
                 f'{self.recipe.title} в список избранного')
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя (recipes.feed).
+
+    pub_date копируется из рецепта, чтобы страница ленты выбиралась
+    по индексу без соединения с таблицей рецептов.
+    """
+    # Индекс по user даёт начало составного индекса ниже.
+    user = models.ForeignKey(User,
+                             verbose_name='Пользователь',
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries',
+                             db_index=False)
+    recipe = models.ForeignKey(Recipe,
+                               verbose_name='Рецепт',
+                               on_delete=models.CASCADE,
+                               related_name='feed_entries')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe_id} в ленте {self.user_id}'
+
+
+class RecipeScore(models.Model):
+    """Популярность рецепта с затуханием по времени (recipes.trending)."""
+    recipe = models.OneToOneField(Recipe,
+                                  verbose_name='Рецепт',
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='trending_score')
+    score = models.FloatField(verbose_name='Счёт', default=0)
+    decayed_at = models.DateTimeField(verbose_name='Затухание учтено на')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(fields=('-score', '-recipe'),
+                         name='recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe_id}: {self.score:.2f}'
@@ -0,0 +1,96 @@
+import re
+
+from django.db import connections
+from django.db.models import Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+# Названия ингредиентов рецепта одной строкой.
+_PG_INGREDIENTS = (
+    "SELECT string_agg(i.name, ' ') FROM recipes_ingredientsrecipe ir "
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = r.id'
+)
+_SQLITE_INGREDIENTS = (
+    "SELECT group_concat(i.name, ' ') FROM recipes_ingredientsrecipe ir "
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = r.id'
+)
+
+# Вес A — название, B — описание, C — ингредиенты.
+PG_UPDATE_SQL = (
+    'UPDATE recipes_recipe r SET search_vector = '
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', r.title), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', r.description), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+    f"coalesce(({_PG_INGREDIENTS}), '')), 'C')"
+)
+SQLITE_DELETE_SQL = f'DELETE FROM {FTS_TABLE}'
+SQLITE_INSERT_SQL = (
+    f'INSERT INTO {FTS_TABLE} (rowid, title, description, ingredients) '
+    'SELECT r.id, r.title, r.description, '
+    f"coalesce(({_SQLITE_INGREDIENTS}), '') FROM recipes_recipe r"
+)
+SQLITE_CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "title, description, ingredients, tokenize = 'unicode61')"
+)
+# Веса столбцов для bm25(): название, описание, ингредиенты.
+SQLITE_WEIGHTS = '10.0, 4.0, 1.0'
+
+
+def refresh_search_index(recipe_ids=None, using='default'):
+    """Пересчитывает поисковый индекс рецептов recipe_ids (всех — для
+    None): столбец search_vector на PostgreSQL или таблицу FTS5 на
+    SQLite."""
+    connection = connections[using]
+    where, params = '', []
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        where, params = f' WHERE r.id IN ({placeholders})', recipe_ids
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(PG_UPDATE_SQL + where, params)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                SQLITE_DELETE_SQL + where.replace('r.id', 'rowid'), params)
+            cursor.execute(SQLITE_INSERT_SQL + where, params)
+
+
+def remove_from_search_index(recipe_id, using='default'):
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'{SQLITE_DELETE_SQL} WHERE rowid = %s',
+                           [recipe_id])
+
+
+def fts_match_query(query):
+    """Запрос FTS5 из слов пользователя: все слова, каждое как префикс.
+
+    Спецсимволы синтаксиса FTS5 отбрасываются, поэтому любой ввод
+    даёт корректный запрос.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def sqlite_search(queryset, query):
+    match = fts_match_query(query)
+    if not match:
+        # rank нужен для сортировки в RecipeQuerySet.search().
+        return queryset.none().annotate(rank=Value(0.0))
+    # bm25() тем меньше, чем лучше совпадение.
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,)
+    )).annotate(rank=RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {SQLITE_WEIGHTS}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+        (match,)
+    ))
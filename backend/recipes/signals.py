@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from recipes import feed, trending
+from recipes.autocomplete import ingredient_index
+from recipes.counters import change_counter
+from recipes.images import is_original
+from recipes.models import (FavoriteList, Ingredient, IngredientsRecipe,
+                            Recipe, ShoppingList)
+from recipes.search import refresh_search_index, remove_from_search_index
+from tasks.queue import enqueue
+from users.models import Follow, User
+
+# Отправляется после массовой загрузки ингредиентов (bulk_create
+# не вызывает post_save).
+ingredients_bulk_loaded = Signal()
+
+
+@receiver(ingredients_bulk_loaded, sender=Ingredient)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_index(sender, instance, using, **kwargs):
+    # После коммита: ингредиенты рецепта сохраняются после самого рецепта.
+    transaction.on_commit(
+        lambda: refresh_search_index([instance.pk], using), using=using)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_index(sender, instance, created,
+                                           using, **kwargs):
+    if not created:
+        recipe_ids = list(IngredientsRecipe.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+        transaction.on_commit(
+            lambda: refresh_search_index(recipe_ids, using), using=using)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search_index(sender, instance, using, **kwargs):
+    remove_from_search_index(instance.pk, using)
+
+
+@receiver(post_save, sender=FavoriteList)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavoriteList)
+def decrement_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def queue_image_renditions(sender, instance, **kwargs):
+    if instance.image and is_original(instance.image.name):
+        enqueue('recipes.image_renditions', {'name': instance.image.name})
+
+
+@receiver(post_save, sender=Follow)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_followers_count(sender, instance, **kwargs):
+    change = change_counter(User, instance.author_id, 'followers_count', -1)
+    threshold = settings.FEED_FANOUT_MAX_FOLLOWERS
+    if change is not None and change[0] >= threshold > change[1]:
+        # Автор опустился ниже порога раскладки: ленты его подписчиков
+        # нужно дополнить его рецептами.
+        enqueue('recipes.feed_rebuild_author',
+                {'author_id': instance.author_id})
+
+
+@receiver(post_save, sender=Recipe)
+def queue_feed_fan_out(sender, instance, created, **kwargs):
+    if created:
+        enqueue('recipes.feed_fan_out', {'recipe_id': instance.pk})
+
+
+@receiver(post_save, sender=Follow)
+def queue_feed_backfill(sender, instance, created, **kwargs):
+    if created:
+        enqueue('recipes.feed_backfill', {'user_id': instance.user_id,
+                                          'author_id': instance.author_id})
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    feed.remove_author(instance.user_id, instance.author_id)
+
+
+SCORE_WEIGHTS = {
+    FavoriteList: trending.FAVORITE_WEIGHT,
+    ShoppingList: trending.SHOPPING_LIST_WEIGHT,
+}
+
+
+@receiver(post_save, sender=FavoriteList)
+@receiver(post_save, sender=ShoppingList)
+def increase_recipe_score(sender, instance, created, using, **kwargs):
+    if created:
+        trending.add(instance.recipe_id, SCORE_WEIGHTS[sender],
+                     instance.added_at, using)
+
+
+@receiver(post_delete, sender=FavoriteList)
+@receiver(post_delete, sender=ShoppingList)
+def decrease_recipe_score(sender, instance, using, **kwargs):
+    trending.add(instance.recipe_id, -SCORE_WEIGHTS[sender],
+                 instance.added_at, using)
@@ -0,0 +1,160 @@
+import io
+import random
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from recipes.management.commands.generate_dataset import Command
+from recipes.models import Ingredient, IngredientsRecipe, Recipe
+from recipes.search import fts_match_query
+from users.models import Follow, User
+
+HOT_LOOKUP_INDEXES = ('recipes', '0012_hot_lookup_indexes')
+BEFORE_HOT_LOOKUP_INDEXES = ('recipes', '0011_remove_unique_ingredient_amount')
+
+
+class HotLookupIndexesMigrationTests(TransactionTestCase):
+    """Миграция с CONCURRENTLY откатывается, применяется заново и
+    переживает повторный запуск после прерванного."""
+
+    def migrate(self, *targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(list(targets) or executor.loader.graph.leaf_nodes())
+
+    def tearDown(self):
+        self.migrate()
+
+    def constraint_names(self, table):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(
+                cursor, table))
+
+    def assert_indexes(self, present):
+        names = (self.constraint_names('recipes_ingredientsrecipe')
+                 | self.constraint_names('recipes_recipe'))
+        for name in ('unique_recipe_ingredient', 'ingredient_recipe_idx',
+                     'recipe_author_pub_date_idx'):
+            with self.subTest(name=name):
+                self.assertIs(name in names, present)
+
+    def test_backward_and_forward(self):
+        self.migrate(BEFORE_HOT_LOOKUP_INDEXES)
+        self.assert_indexes(False)
+        self.migrate(HOT_LOOKUP_INDEXES)
+        self.assert_indexes(True)
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'CONCURRENTLY есть только в PostgreSQL')
+    def test_rerun_after_interrupted_run(self):
+        self.migrate(HOT_LOOKUP_INDEXES)
+        # Запуск прервался после CREATE UNIQUE INDEX, до ALTER TABLE и
+        # второго индекса; третий индекс уже готов.
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE recipes_ingredientsrecipe '
+                           'DROP CONSTRAINT unique_recipe_ingredient')
+            cursor.execute('CREATE UNIQUE INDEX unique_recipe_ingredient '
+                           'ON recipes_ingredientsrecipe '
+                           '(recipe_id, ingredient_id)')
+            cursor.execute('DROP INDEX ingredient_recipe_idx')
+        MigrationRecorder(connection).record_unapplied(*HOT_LOOKUP_INDEXES)
+        self.migrate(HOT_LOOKUP_INDEXES)
+        self.assert_indexes(True)
+        # Повторный запуск после полностью выполненных операций.
+        MigrationRecorder(connection).record_unapplied(*HOT_LOOKUP_INDEXES)
+        self.migrate(HOT_LOOKUP_INDEXES)
+        self.assert_indexes(True)
+
+
+class RecipeSearchTests(TestCase):
+    """Поиск: порядок по полю совпадения, обновление индекса после
+    изменений и устойчивость к любому вводу."""
+
+    def setUp(self):
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        self.saffron = Ingredient.objects.create(name='шафран', unit='г')
+        salt = Ingredient.objects.create(name='соль', unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_title, self.by_description, self.by_ingredient = [
+                Recipe.objects.create(author=author, title=title,
+                                      description=description, time=5)
+                for title, description in (
+                    ('Плов с шафраном', 'Рис и морковь'),
+                    ('Плов с морковью', 'Рис и немного шафрана'),
+                    ('Плов с изюмом', 'Рис и морковь'),
+                )
+            ]
+            for recipe, ingredient in ((self.by_title, salt),
+                                       (self.by_description, salt),
+                                       (self.by_ingredient, self.saffron)):
+                IngredientsRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+            Recipe.objects.ingredients_changed()
+
+    def found(self, query):
+        return list(Recipe.objects.search(query).values_list('pk', flat=True))
+
+    def test_title_then_description_then_ingredients(self):
+        self.assertEqual(self.found('шафран'), [
+            self.by_title.pk, self.by_description.pk, self.by_ingredient.pk])
+
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_description.title = 'Плов с кардамоном'
+            self.by_description.save()
+        self.assertEqual(self.found('кардамон'), [self.by_description.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.saffron.name = 'куркума'
+            self.saffron.save()
+        self.assertEqual(self.found('куркума'), [self.by_ingredient.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_title.delete()
+        self.assertEqual(self.found('шафран'), [self.by_description.pk])
+
+    def test_malformed_query(self):
+        self.assertEqual(fts_match_query('"соль" OR -перец*'),
+                         '"соль"* "OR"* "перец"*')
+        self.assertEqual(fts_match_query('"(*)": -'), '')
+        for query in ('"', '(', 'плов AND', '*', 'NEAR(плов', '-рис',
+                      "'", 'плов:*', '!!!'):
+            with self.subTest(query=query):
+                self.assertIsInstance(self.found(query), list)
+
+
+class CreatePairsTests(TestCase):
+    """Генератор данных добирает пары до нужного числа поверх уже
+    сохранённых и останавливается, когда свободных пар не осталось."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@example.com')
+            for number in range(4)]
+        self.user_ids = [user.pk for user in self.users]
+        Follow.objects.create(user=self.users[0], author=self.users[1])
+        self.command = Command(stdout=io.StringIO())
+        self.command.random = random.Random(0)
+        self.command.batch_size = 5
+        self.command.alpha = 1.1
+
+    def create_follows(self, count):
+        self.command.create_pairs(Follow, 'user_id', 'author_id', count,
+                                  self.user_ids, self.user_ids,
+                                  distinct=True)
+
+    def test_tops_up_existing_pairs(self):
+        self.create_follows(8)
+        self.assertEqual(Follow.objects.count(), 9)
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+
+    def test_stops_when_pairs_run_out(self):
+        # Всего 4 * 3 = 12 пар из разных пользователей, одна уже есть.
+        self.command.batch_size = 100
+        self.create_follows(20)
+        self.assertEqual(Follow.objects.count(), 12)
+        self.assertIn('создано 11 из 20',
+                      self.command.stdout._out.getvalue())
@@ -0,0 +1,110 @@
+"""Популярность рецептов с затуханием по времени.
+
+Добавление рецепта в избранное или список покупок сразу увеличивает
+его счёт в RecipeScore, удаление — уменьшает. manage.py decay_scores,
+запускаемая по расписанию (например, раз в час), умножает счета на
+0.5 ** (прошло времени / TRENDING_HALF_LIFE_HOURS): недавние
+добавления весят больше старых. Список популярных — первые строки
+индекса recipe_score_idx, без агрегации по избранному.
+
+Счёт строки хранится на момент её decayed_at, поэтому добавление,
+сделанное позже, прибавляется с ростом 2 ** (добавлено − decayed_at) /
+период полураспада: после следующего затухания оно весит ровно как
+свежее, а не теряет до интервала между запусками decay_scores.
+Удаление вычитает вклад по added_at той же записи, то есть уже
+затухший, и счёт остаётся суммой вкладов оставшихся записей.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from recipes.models import FavoriteList, RecipeScore, ShoppingList
+
+FAVORITE_WEIGHT = 1.0
+SHOPPING_LIST_WEIGHT = 0.5
+
+
+def decay_mark():
+    """decayed_at новой строки, с точностью до минуты: decay_scores
+    обновляет строки группами с одинаковым decayed_at."""
+    return timezone.now().replace(second=0, microsecond=0)
+
+
+def growth(decayed_at, moment):
+    """Множитель для веса, добавленного в moment, в счёте строки,
+    затухание которой учтено на decayed_at."""
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    return 2 ** ((moment - decayed_at).total_seconds() / half_life)
+
+
+def add(recipe_id, weight, added_at, using='default'):
+    """Изменяет счёт рецепта на вклад записи с весом weight, добавленной
+    в added_at; отрицательный weight убирает этот вклад. Счёт не
+    опускается ниже нуля."""
+    scores = RecipeScore.objects.using(using).filter(recipe_id=recipe_id)
+    while True:
+        decayed_at = scores.values_list('decayed_at', flat=True).first()
+        if decayed_at is None:
+            if weight < 0:
+                # Строку уже удалил decay как ничтожную.
+                return
+            # Строку могли создать параллельно: тогда INSERT
+            # пропускается, а прибавка всё равно попадает в счёт.
+            RecipeScore.objects.using(using).bulk_create(
+                [RecipeScore(recipe_id=recipe_id, decayed_at=decay_mark())],
+                ignore_conflicts=True)
+            continue
+        score = F('score') + weight * growth(decayed_at, added_at)
+        if weight < 0:
+            score = Greatest(score, Value(0.0))
+        # Если decay успел сдвинуть decayed_at, множитель устарел:
+        # UPDATE не найдёт строку, и вклад пересчитается заново.
+        if scores.filter(decayed_at=decayed_at).update(score=score):
+            return
+
+
+def decay(now=None):
+    """Применяет затухание ко всем счетам и удаляет ничтожные.
+
+    Возвращает число обновлённых и удалённых строк. Каждая строка
+    умножается одним UPDATE с F(), поэтому параллельные add() не
+    теряются.
+    """
+    now = now or timezone.now()
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    marks = list(RecipeScore.objects.filter(decayed_at__lt=now).order_by(
+        ).values_list('decayed_at', flat=True).distinct())
+    decayed = 0
+    for decayed_at in marks:
+        factor = 0.5 ** ((now - decayed_at).total_seconds() / half_life)
+        decayed += RecipeScore.objects.filter(decayed_at=decayed_at).update(
+            score=F('score') * factor, decayed_at=now)
+    removed, _ = RecipeScore.objects.filter(
+        score__lt=settings.TRENDING_MIN_SCORE).delete()
+    return decayed, removed
+
+
+def rebuild():
+    """Счета по текущему избранному и спискам покупок.
+
+    Вклад каждой записи считается по её added_at, как если бы она
+    прошла через add(); нужна для первого заполнения и данных,
+    загруженных в обход сигналов.
+    """
+    decayed_at = decay_mark()
+    scores = defaultdict(float)
+    for model, weight in ((FavoriteList, FAVORITE_WEIGHT),
+                          (ShoppingList, SHOPPING_LIST_WEIGHT)):
+        added = model.objects.order_by().values_list('recipe_id', 'added_at')
+        for recipe_id, added_at in added.iterator():
+            scores[recipe_id] += weight * growth(decayed_at, added_at)
+    rows = [
+        RecipeScore(recipe_id=recipe_id, score=score, decayed_at=decayed_at)
+        for recipe_id, score in scores.items()
+        if score >= settings.TRENDING_MIN_SCORE
+    ]
+    RecipeScore.objects.all().delete()
+    RecipeScore.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -1,28 +1,142 @@
-from django.db.models import Sum
+import csv
+import io
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from recipes.models import FavoriteList, Ingredient, IngredientsRecipe
+from recipes.models import FavoriteList, IngredientsRecipe
 from rest_framework import status
 from rest_framework.response import Response
 
+SHOPPING_LIST_TITLE = 'Foodgram. Список покупок'
+SHOPPING_LIST_FILENAME = 'shopping_list'
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
 
-def create_shopping_list_report(shopping_cart):
-    recipes = shopping_cart.values_list('recipe_id', flat=True)
-    buy_list = IngredientsRecipe.objects.filter(
-        recipe__in=recipes
+def get_shopping_list(shopping_cart):
+    """Сводный список ингредиентов корзины одним сгруппированным запросом.
+
+    Возвращает словари с ключами name, unit и amount,
+    отсортированные по названию ингредиента.
+    """
+    return IngredientsRecipe.objects.filter(
+        recipe__in=shopping_cart.values('recipe_id')
     ).values(
-        'ingredient'
+        name=F('ingredient__name'),
+        unit=F('ingredient__unit')
     ).annotate(
         amount=Sum('amount')
-    )
-    buy_list_text = 'Foodgram\nСписок покупок:\n'
-    for item in buy_list:
-        ingredient = Ingredient.objects.get(pk=item['ingredient'])
-        amount = item['amount']
-        buy_list_text += (
-            f'{ingredient.name}, {amount} '
-            f'{ingredient.unit}\n'
+    ).order_by('name')
+
+
+def iter_shopping_list_txt(items):
+    yield f'{SHOPPING_LIST_TITLE}\n\n'
+    for item in items:
+        yield f'{item["name"]}, {item["amount"]} {item["unit"]}\n'
+
+
+class _Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_shopping_list_csv(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in items:
+        yield writer.writerow((item['name'], item['amount'], item['unit']))
+
+
+def _register_pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
         )
-    return buy_list_text
+
+
+def render_shopping_list_pdf(items):
+    """Постраничный PDF: новая страница, когда заканчивается место.
+
+    reportlab собирает документ целиком, поэтому PDF возвращается
+    готовыми байтами, а не потоком.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    _register_pdf_font()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    page = 1
+
+    def start_page():
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, SHOPPING_LIST_TITLE)
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE - 2)
+        pdf.drawRightString(width - PDF_MARGIN, PDF_MARGIN / 2, str(page))
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        return height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+
+    y = start_page()
+    for item in items:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            page += 1
+            y = start_page()
+        pdf.drawString(
+            PDF_MARGIN, y,
+            f'• {item["name"]} ({item["unit"]}) — {item["amount"]}'
+        )
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    return buffer.getvalue()
+
+
+# Формат: (функция, content type, отдаётся ли потоком). Потоковые
+# функции возвращают итератор строк, остальные — байты файла.
+SHOPPING_LIST_FORMATS = {
+    'txt': (iter_shopping_list_txt, 'text/plain; charset=utf-8', True),
+    'csv': (iter_shopping_list_csv, 'text/csv; charset=utf-8', True),
+    'pdf': (render_shopping_list_pdf, 'application/pdf', False),
+}
+
+
+def create_shopping_list_report(shopping_cart, file_type='txt'):
+    """Ответ со списком покупок в выбранном формате: txt и csv
+    отдаются потоком, pdf — целиком."""
+    renderer, content_type, streaming = SHOPPING_LIST_FORMATS[file_type]
+    items = get_shopping_list(shopping_cart).iterator()
+    response_class = StreamingHttpResponse if streaming else HttpResponse
+    response = response_class(renderer(items), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{SHOPPING_LIST_FILENAME}.{file_type}"'
+    )
+    return response
+
+
+def save_shopping_list_report(shopping_cart, file_type, directory):
+    """Сохраняет список покупок в хранилище и возвращает путь к файлу."""
+    renderer, _, streaming = SHOPPING_LIST_FORMATS[file_type]
+    content = renderer(get_shopping_list(shopping_cart).iterator())
+    if streaming:
+        content = ''.join(content).encode()
+    return default_storage.save(
+        f'{directory}/{uuid.uuid4().hex}/{SHOPPING_LIST_FILENAME}.'
+        f'{file_type}',
+        ContentFile(content)
+    )
 
 
 def remove_recipe_from_favorites(user, recipe):
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from tasks.models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'created_at',
+                    'finished_at']
+    list_filter = ['status', 'name']
+    list_select_related = ['user']
+    readonly_fields = ['locked_by', 'locked_until', 'result', 'error',
+                       'created_at', 'finished_at']
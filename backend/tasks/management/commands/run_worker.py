@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from tasks.queue import claim, run_claimed
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задачи фоновой очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.TASKS_WORKER_CONCURRENCY,
+            help='Сколько задач выполнять одновременно.')
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'),
+            default=settings.TASKS_WORKER_POOL,
+            help='Пул потоков (задачи с вводом-выводом) или процессов '
+                 '(задачи, нагружающие процессор).')
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.TASKS_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, с.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        executor = self.create_executor(options['pool'], concurrency)
+        self.stdout.write(
+            f'Обработчик {worker}: {options["pool"]} x {concurrency}')
+        running = set()
+        self.succeeded = self.failed = 0
+        try:
+            while not stop.is_set():
+                free = concurrency - len(running)
+                try:
+                    claimed = claim(worker, free) if free else []
+                except DatabaseError as error:
+                    self.stderr.write(f'Очередь недоступна: {error}')
+                    claimed = []
+                for task in claimed:
+                    running.add(executor.submit(
+                        run_claimed, task.pk, task.locked_by))
+                if not running:
+                    if options['once']:
+                        break
+                    stop.wait(options['poll_interval'])
+                    continue
+                if claimed and len(running) < concurrency:
+                    # В очереди могли остаться готовые задачи: забрать сразу.
+                    continue
+                done, running = wait(running,
+                                     timeout=options['poll_interval'],
+                                     return_when=FIRST_COMPLETED)
+                self.count(done)
+        finally:
+            executor.shutdown(wait=True)
+        self.count(running)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {self.succeeded}, '
+            f'с ошибкой: {self.failed}'))
+
+    def count(self, futures):
+        for future in futures:
+            try:
+                succeeded = future.result()
+            except Exception:
+                # Ошибка вне задачи (например, база недоступна при
+                # сохранении итога) не должна останавливать обработчик;
+                # задачу заберёт claim(), когда истечёт аренда.
+                logger.exception('Не удалось выполнить задачу')
+                succeeded = False
+            if succeeded:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def create_executor(self, pool, concurrency):
+        if pool == 'thread':
+            return ThreadPoolExecutor(max_workers=concurrency,
+                                      thread_name_prefix='task-worker')
+        # Дочерние процессы запускаются через spawn: открытые соединения
+        # с базой не должны наследоваться при fork.
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Задача фоновой очереди."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(verbose_name='Задача', max_length=128)
+    payload = models.JSONField(verbose_name='Аргументы', default=dict)
+    status = models.CharField(verbose_name='Статус', max_length=16,
+                              choices=STATUSES, default=QUEUED)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             verbose_name='Пользователь',
+                             on_delete=models.CASCADE,
+                             related_name='tasks',
+                             null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток',
+                                                default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток', default=3)
+    run_after = models.DateTimeField(verbose_name='Не раньше',
+                                     default=timezone.now)
+    locked_until = models.DateTimeField(verbose_name='Занята до',
+                                        null=True, blank=True)
+    locked_by = models.CharField(verbose_name='Обработчик', max_length=128,
+                                 blank=True)
+    result = models.JSONField(verbose_name='Результат', null=True,
+                              blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана',
+                                      auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена',
+                                       null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=('status', 'run_after'),
+                         name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,140 @@
+import logging
+import traceback
+import uuid
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from tasks.models import Task
+
+logger = logging.getLogger(__name__)
+
+TaskSpec = namedtuple('TaskSpec', ('func', 'max_attempts', 'retry_delay'))
+
+registry = {}
+
+
+def task(name, max_attempts=3, retry_delay=10):
+    """Регистрирует функцию как фоновую задачу name.
+
+    Функция получает payload задачи как именованные аргументы и
+    возвращает JSON-совместимый результат. После ошибки задача
+    повторяется через retry_delay, 2 * retry_delay, ... секунд,
+    всего не больше max_attempts раз.
+    """
+    def decorator(func):
+        registry[name] = TaskSpec(func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def _lease(now):
+    return now + timedelta(seconds=settings.TASKS_VISIBILITY_TIMEOUT)
+
+
+def enqueue(name, payload=None, user=None, delay=0):
+    """Ставит задачу в очередь и возвращает её.
+
+    Очередь — таблица в той же базе, поэтому задача, поставленная
+    внутри транзакции, станет видна обработчику только после коммита.
+    При TASKS_EAGER задача сразу выполняется в текущем процессе.
+    """
+    if name not in registry:
+        raise ValueError(f'Неизвестная задача: {name}')
+    now = timezone.now()
+    task = Task(name=name, payload=payload or {}, user=user,
+                max_attempts=registry[name].max_attempts,
+                run_after=now + timedelta(seconds=delay))
+    if not settings.TASKS_EAGER:
+        task.save()
+        return task
+    task.status = Task.RUNNING
+    task.attempts = 1
+    task.locked_by = f'eager:{uuid.uuid4().hex}'
+    task.locked_until = _lease(now)
+    task.save()
+    execute(task, retry=False)
+    return task
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых к выполнению задач.
+
+    Задача арендуется на TASKS_VISIBILITY_TIMEOUT секунд; если
+    обработчик за это время её не завершил (например, процесс упал),
+    задачу заберёт следующий вызов claim().
+    """
+    now = timezone.now()
+    Task.objects.filter(
+        status=Task.RUNNING, locked_until__lt=now,
+        attempts__gte=F('max_attempts'),
+    ).update(status=Task.FAILED, locked_until=None, finished_at=now,
+             error='Превышено время выполнения.')
+    ready = Task.objects.filter(
+        Q(status=Task.QUEUED, run_after__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now)
+    )
+    token = f'{worker}:{uuid.uuid4().hex}'
+    candidates = ready.order_by('run_after', 'pk')
+    skip_locked = connections[
+        candidates.db].features.has_select_for_update_skip_locked
+    # Без SKIP LOCKED (SQLite) отбор не блокирует строки, а условие
+    # повторяется в UPDATE: задачу получит только один из
+    # конкурирующих обработчиков.
+    with transaction.atomic() if skip_locked else nullcontext():
+        if skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        ready.filter(pk__in=ids).update(
+            status=Task.RUNNING, locked_by=token, locked_until=_lease(now),
+            attempts=F('attempts') + 1)
+    return list(Task.objects.filter(locked_by=token).order_by('pk'))
+
+
+def _finish(task, **fields):
+    updated = Task.objects.filter(
+        pk=task.pk, locked_by=task.locked_by
+    ).update(locked_until=None, **fields)
+    if not updated:
+        logger.warning('Аренда задачи %s истекла, результат отброшен', task)
+    for field, value in fields.items():
+        setattr(task, field, value)
+    task.locked_until = None
+
+
+def execute(task, retry=True):
+    """Выполняет арендованную задачу в транзакции и сохраняет итог."""
+    spec = registry.get(task.name)
+    try:
+        if spec is None:
+            raise LookupError(f'Неизвестная задача: {task.name}')
+        with transaction.atomic():
+            result = spec.func(**task.payload)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', task)
+        error = traceback.format_exc()
+        now = timezone.now()
+        if retry and spec is not None and task.attempts < task.max_attempts:
+            delay = spec.retry_delay * 2 ** (task.attempts - 1)
+            _finish(task, status=Task.QUEUED, error=error,
+                    run_after=now + timedelta(seconds=delay))
+        else:
+            _finish(task, status=Task.FAILED, error=error, finished_at=now)
+        return False
+    _finish(task, status=Task.DONE, result=result, error='',
+            finished_at=timezone.now())
+    return True
+
+
+def run_claimed(pk, token):
+    """Выполняет задачу, полученную claim(); вызывается в пуле."""
+    close_old_connections()
+    try:
+        task = Task.objects.filter(pk=pk, locked_by=token).first()
+        return task is not None and execute(task)
+    finally:
+        close_old_connections()
@@ -0,0 +1,157 @@
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock, skipIf, skipUnless
+
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from tasks import queue
+from tasks.management.commands.run_worker import Command
+from tasks.models import Task
+
+
+def succeed(**payload):
+    return payload
+
+
+def fail(**payload):
+    raise RuntimeError('ошибка задачи')
+
+
+class QueueTestMixin:
+    """Задачи tests.succeed и tests.fail в реестре очереди."""
+
+    def setUp(self):
+        super().setUp()
+        registry = mock.patch.dict(queue.registry, {
+            'tests.succeed': queue.TaskSpec(succeed, 3, 10),
+            'tests.fail': queue.TaskSpec(fail, 3, 10),
+        })
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def create(self, name='tests.succeed', **fields):
+        return Task.objects.create(name=name, payload={'value': 1},
+                                   **fields)
+
+
+class QueueTests(QueueTestMixin, TestCase):
+    """Аренда, повторы с задержкой и потерянная аренда."""
+
+    def expired(self, attempts):
+        return self.create(status=Task.RUNNING, attempts=attempts,
+                           locked_by='old:token',
+                           locked_until=timezone.now() - timedelta(1))
+
+    def test_reclaim_expired_lease(self):
+        task = self.expired(attempts=1)
+        claimed, = queue.claim('worker', 10)
+        self.assertEqual(claimed.pk, task.pk)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertNotEqual(claimed.locked_by, 'old:token')
+        self.assertGreater(claimed.locked_until, timezone.now())
+
+    def test_expired_lease_without_attempts_fails(self):
+        task = self.expired(attempts=3)
+        self.assertEqual(queue.claim('worker', 10), [])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIsNone(task.locked_until)
+        self.assertTrue(task.error)
+
+    def test_claimed_task_not_claimed_again(self):
+        self.create()
+        self.assertEqual(len(queue.claim('first', 10)), 1)
+        self.assertEqual(queue.claim('second', 10), [])
+
+    @skipIf(connection.features.has_select_for_update_skip_locked,
+            'с SKIP LOCKED отбор блокирует строки')
+    def test_claim_race_without_skip_locked(self):
+        # Второй обработчик забирает задачи между отбором и UPDATE
+        # первого: UPDATE первого повторяет условие и не находит их.
+        tasks = [self.create(), self.create()]
+        lease = queue._lease
+        rival = None
+
+        def claim_in_between(now):
+            nonlocal rival
+            if rival is None:
+                rival = []
+                rival = queue.claim('second', 10)
+            return lease(now)
+
+        with mock.patch.object(queue, '_lease', claim_in_between):
+            self.assertEqual(queue.claim('first', 10), [])
+        self.assertEqual([task.pk for task in rival],
+                         [task.pk for task in tasks])
+
+    def test_retry_backoff(self):
+        task = self.create('tests.fail', max_attempts=3)
+        for attempt, delay in ((1, 10), (2, 20)):
+            claimed, = queue.claim('worker', 10)
+            with self.assertLogs('tasks.queue', 'ERROR'):
+                self.assertFalse(queue.execute(claimed))
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts),
+                             (Task.QUEUED, attempt))
+            self.assertAlmostEqual(
+                (task.run_after - timezone.now()).total_seconds(), delay,
+                delta=5)
+            self.assertEqual(queue.claim('worker', 10), [])
+            Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        claimed, = queue.claim('worker', 10)
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            queue.execute(claimed)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 3))
+        self.assertIn('ошибка задачи', task.error)
+
+    def test_result_dropped_after_lease_lost(self):
+        task = self.create()
+        claimed, = queue.claim('worker', 10)
+        Task.objects.filter(pk=task.pk).update(locked_by='other:token')
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            self.assertTrue(queue.execute(claimed))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.locked_by, task.result),
+                         (Task.RUNNING, 'other:token', None))
+
+    def test_worker_survives_run_claimed_error(self):
+        command = Command()
+        command.succeeded = command.failed = 0
+        futures = [Future(), Future()]
+        futures[0].set_result(True)
+        futures[1].set_exception(DatabaseError('нет соединения'))
+        with self.assertLogs(
+                'tasks.management.commands.run_worker', 'ERROR'):
+            command.count(futures)
+        self.assertEqual((command.succeeded, command.failed), (1, 1))
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked,
+            'нужен SELECT ... FOR UPDATE SKIP LOCKED')
+class ConcurrentClaimTests(QueueTestMixin, TransactionTestCase):
+    """Параллельные обработчики не получают одну задачу дважды."""
+
+    def test_concurrent_claims(self):
+        tasks = [self.create() for _ in range(20)]
+        barrier = threading.Barrier(4)
+        claimed = []
+
+        def work(worker):
+            try:
+                barrier.wait()
+                claimed.append(queue.claim(worker, 8))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(f'worker{number}',))
+                   for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pks = [task.pk for batch in claimed for task in batch]
+        self.assertEqual(len(pks), len(set(pks)))
+        self.assertEqual(set(pks), {task.pk for task in tasks})
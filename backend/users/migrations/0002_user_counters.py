@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    )
+
+
+def recount_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(favorites_count=count_related(
+        apps.get_model('recipes', 'FavoriteList'), 'recipe'))
+    apps.get_model('users', 'User').objects.update(
+        recipes_count=count_related(Recipe, 'author'),
+        followers_count=count_related(
+            apps.get_model('users', 'Follow'), 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0006_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
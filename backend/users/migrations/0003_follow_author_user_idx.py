@@ -0,0 +1,19 @@
+from django.db import migrations, models
+from foodgram_backend.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции.
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'],
+                               name='follow_author_user_idx'),
+        ),
+    ]
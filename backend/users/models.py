@@ -1,9 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
 from django.db import models
+from recipes.counters import CounterFieldsMixin
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         blank=False,
         verbose_name='Логин',
@@ -27,6 +28,12 @@ class User(AbstractUser):
         blank=False,
         verbose_name='Фамилия',
         max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков', default=0, editable=False)
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -66,6 +73,11 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_follow')
         ]
+        indexes = [
+            # Подписчики автора: user_id берётся из индекса.
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'Пользователь:{self.user} подписался на {self.author}'
@@ -1,4 +1,6 @@
-from api.serializers import CustomUserSerializer, FollowSerializer
+from api.pagination import FeedPagination, LimitPageNumberPagination
+from api.serializers import (CustomUserSerializer, RecipeSerializer,
+                             SubscriptionSerializer)
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -12,43 +14,66 @@ class CustomUserViewSet(UserViewSet):
     """Вьюсет пользователей."""
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
+    pagination_class = LimitPageNumberPagination
+    query_budgets = {'list': 6, 'retrieve': 5, 'me': 4, 'subscriptions': 8,
+                     'feed': 10}
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return max(limit, 0)
 
     @action(methods=['GET'], detail=False,
             permission_classes=[IsAuthenticated])
     def me(self, request):
-        serializer = CustomUserSerializer(request.user)
+        serializer = CustomUserSerializer(request.user,
+                                          context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    @action(detail=True, methods=['GET'],
+    @action(detail=False, methods=['GET'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         """Список подписок."""
-        user = request.user
-        queryset = Follow.objects.filter(user=user)
-        pages = self.paginate_queryset(queryset)
-        serializer = FollowSerializer(
+        authors = User.objects.filter(following__user=request.user)
+        pages = self.paginate_queryset(authors)
+        SubscriptionSerializer.attach_recipes(pages, self.get_recipes_limit())
+        serializer = SubscriptionSerializer(
             pages, many=True, context={'request': request}
         )
-        return self.get_paginated_response(serializer.data,
-                                           status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Рецепты авторов из подписок, сначала новые; ?cursor=."""
+        recipes = self.paginator.paginate_feed(request.user, request)
+        serializer = RecipeSerializer(
+            recipes, many=True,
+            context={'request': request, 'image_rendition': 'thumbnail'})
+        return self.get_paginated_response(serializer.data)
 
-    @action(detail=True, methods=['POST', 'DELETE'])
-    def subscribe(self, request, pk=None):
+    @action(detail=True, methods=['POST', 'DELETE'],
+            permission_classes=[IsAuthenticated])
+    def subscribe(self, request, id=None):
         """Подписаться или отписаться"""
         user = request.user
-        author = get_object_or_404(User, pk=pk)
+        author = get_object_or_404(User, pk=id)
         if user == author:
             return Response({'errors': 'Ошибка подписки'},
                             status=status.HTTP_400_BAD_REQUEST)
-        data = {
-            'user': user.id,
-            'author': author.id,
-        }
         if request.method == 'POST':
-            serializer = FollowSerializer(data=data,
-                                          context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            _, created = Follow.objects.get_or_create(user=user,
+                                                      author=author)
+            if not created:
+                return Response({'errors': 'Вы уже подписаны на автора'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            SubscriptionSerializer.attach_recipes([author],
+                                                  self.get_recipes_limit())
+            serializer = SubscriptionSerializer(author,
+                                                context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             try:
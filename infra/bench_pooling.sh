@@ -0,0 +1,42 @@
+#!/bin/sh
+# Задержка /api/recipes/ (p50, p90, p99) при трёх режимах соединений
+# бэкенда с PostgreSQL: новое соединение на запрос, постоянные
+# соединения и pgbouncer. Запуск из каталога infra при поднятом стеке:
+#
+#     TOKEN=<токен пользователя> ./bench_pooling.sh
+#
+# Запросы с токеном идут мимо микрокеша nginx и доходят до базы.
+set -e
+
+: "${TOKEN:?Укажите токен пользователя в переменной TOKEN}"
+BASE_URL=${BASE_URL:-http://localhost:8080}
+REQUESTS=${REQUESTS:-2000}
+CONCURRENCY=${CONCURRENCY:-32}
+
+run() {
+    label=$1
+    shift
+    env "$@" docker compose up -d --no-deps backend >/dev/null
+    until docker compose exec -T backend python -c "import urllib.request; urllib.request.urlopen('http://localhost:8080/api/health/ready/', timeout=3)" >/dev/null 2>&1; do
+        sleep 1
+    done
+    echo "== $label"
+    python3 loadtest.py --base-url "$BASE_URL" --path /api/recipes/ \
+        -n "$REQUESTS" -c "$CONCURRENCY" --warmup 100 --token "$TOKEN"
+}
+
+docker compose up -d pgbouncer >/dev/null
+
+run 'новое соединение на запрос' \
+    BACKEND_DB_HOST=db BACKEND_DB_PORT=5432 DB_CONN_MAX_AGE=0
+run 'постоянные соединения' \
+    BACKEND_DB_HOST=db BACKEND_DB_PORT=5432 DB_CONN_MAX_AGE=60
+run 'pgbouncer, новое соединение на запрос' \
+    BACKEND_DB_HOST=pgbouncer BACKEND_DB_PORT=6432 DB_CONN_MAX_AGE=0 \
+    DB_DISABLE_SERVER_SIDE_CURSORS=True
+run 'pgbouncer, постоянные соединения' \
+    BACKEND_DB_HOST=pgbouncer BACKEND_DB_PORT=6432 DB_CONN_MAX_AGE=60 \
+    DB_DISABLE_SERVER_SIDE_CURSORS=True
+
+# Исходные настройки из .env.
+docker compose up -d --no-deps backend >/dev/null
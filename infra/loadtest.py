@@ -0,0 +1,138 @@
+"""Нагрузочный тест API без сторонних зависимостей.
+
+Каждый путь запрашивается --requests раз в --concurrency потоков,
+у каждого потока своё keep-alive соединение. Для каждого пути
+печатаются пропускная способность, перцентили задержки и доля
+ответов из кеша nginx (заголовок X-Cache-Status).
+
+Выигрыш от микрокеша виден при сравнении двух запусков:
+
+    python infra/loadtest.py --base-url http://localhost:8080
+    python infra/loadtest.py --base-url http://localhost:8080 \\
+        --token <токен>
+
+Во втором запуске запросы с токеном идут мимо кеша до бэкенда.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/tags/',
+    '/api/ingredients/?name=%D0%B0',
+)
+
+
+def percentile(values, share):
+    """Перцентиль share (0..1) отсортированного списка values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, round(share * (len(values) - 1)))
+    return values[index]
+
+
+class Client(threading.local):
+    """Отдельное keep-alive соединение для каждого потока."""
+
+    def __init__(self, base_url, headers, timeout):
+        url = urlsplit(base_url)
+        connection_class = (http.client.HTTPSConnection
+                            if url.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.connection = connection_class(url.netloc, timeout=timeout)
+        self.headers = headers
+
+    def get(self, path):
+        started = time.perf_counter()
+        try:
+            self.connection.request('GET', path, headers=self.headers)
+            response = self.connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return time.perf_counter() - started, None, None, 0
+        return (time.perf_counter() - started, response.status,
+                response.getheader('X-Cache-Status'), len(body))
+
+
+def run(base_url, path, requests, concurrency, headers, timeout):
+    client = Client(base_url, headers, timeout)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: client.get(path),
+                                range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(result[0] * 1000 for result in results)
+    statuses = Counter(str(result[1]) for result in results)
+    cache = Counter(result[2] for result in results if result[2])
+    return {
+        'path': path,
+        'requests': requests,
+        'concurrency': concurrency,
+        'rps': round(requests / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2),
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p90': round(percentile(latencies, 0.90), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2),
+        },
+        'statuses': dict(statuses),
+        'cache': dict(cache),
+        'bytes': sum(result[3] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8080')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Путь для теста; можно указать несколько раз.')
+    parser.add_argument('-n', '--requests', type=int, default=500)
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('--token',
+                        help='Токен пользователя: запросы идут мимо кеша.')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Отправлять Accept-Encoding: gzip.')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='Запросов на путь до начала замера.')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--json', action='store_true',
+                        help='Вывести результат в JSON.')
+    options = parser.parse_args()
+
+    headers = {'Accept': 'application/json'}
+    if options.token:
+        headers['Authorization'] = f'Token {options.token}'
+    if options.gzip:
+        headers['Accept-Encoding'] = 'gzip'
+    reports = []
+    for path in options.paths or DEFAULT_PATHS:
+        if options.warmup:
+            run(options.base_url, path, options.warmup,
+                options.concurrency, headers, options.timeout)
+        reports.append(run(options.base_url, path, options.requests,
+                           options.concurrency, headers, options.timeout))
+    if options.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return
+    for report in reports:
+        latency = report['latency_ms']
+        cache = ' '.join(f'{status}={count}'
+                         for status, count in report['cache'].items())
+        print(f"{report['path']:<32} {report['rps']:>8} rps  "
+              f"p50 {latency['p50']:>7} ms  p90 {latency['p90']:>7} ms  "
+              f"p99 {latency['p99']:>7} ms  {report['statuses']}  "
+              f'{cache or "без кеша"}')
+
+
+if __name__ == '__main__':
+    main()